@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import sqlite3
-from database import create_connection, add_task
+from database import create_connection, create_tables, import_tasks
 
 # Список всех заданий
 tasks = [
@@ -64,16 +64,15 @@ def main():
     try:
         # Подключаемся к базе данных
         conn = create_connection()
+        create_tables(conn)
         
         print(f"Начинаю добавление {len(tasks)} заданий в базу данных...")
         
-        # Добавляем каждое задание
-        for i, task in enumerate(tasks, 1):
-            add_task(conn, task)
-            print(f"Добавлено задание {i}: {task[:50]}...")
+        # Добавляем все задания одной транзакцией, пропуская уже существующие
+        task_ids, skipped = import_tasks(conn, tasks)
         
         conn.close()
-        print(f"\nВсе {len(tasks)} заданий успешно добавлены в базу данных!")
+        print(f"\nДобавлено {len(task_ids)} заданий, пропущено дубликатов: {skipped}")
         
     except Exception as e:
         print(f"Ошибка при добавлении заданий: {e}")
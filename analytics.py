@@ -0,0 +1,75 @@
+import time
+
+from aiogram import Bot
+
+import async_database
+from database import EVENT_ASSIGN, EVENT_ACCEPT, EVENT_DECLINE, EVENT_COMPLETE, EVENT_REJECT, event_day
+from user_cache import user_cache
+
+EVENT_NAMES = {
+    EVENT_ASSIGN: "выдано",
+    EVENT_ACCEPT: "принято",
+    EVENT_DECLINE: "отклонено",
+    EVENT_COMPLETE: "зачтено",
+    EVENT_REJECT: "не зачтено",
+}
+
+# Периоды рейтингов: (название, количество дней включая сегодняшний).
+PERIODS = (("7 дней", 7), ("30 дней", 30))
+
+TOP_TASKS = 5
+TOP_USERS = 10
+
+
+def since_day(days: int) -> str:
+    """
+    Возвращает первый день периода из days дней, включая сегодняшний.
+    """
+    return event_day(time.time() - (days - 1) * 86400)
+
+
+def format_counts(counts: dict) -> str:
+    return ", ".join(f"{name}: {counts.get(kind, 0)}" for kind, name in EVENT_NAMES.items())
+
+
+async def render_analytics(bot: Bot, limit: int = 4000) -> str:
+    """
+    Возвращает текст отчета для команды /analytics.
+
+    Отчет строится только по агрегатам task_rollup, chat_rollup,
+    daily_rollup и user_daily_rollup, без чтения журнала событий.
+
+    :param bot: Экземпляр бота Aiogram для получения имен.
+    :param limit: Максимальная длина текста.
+    :return: Текст отчета.
+    """
+    text = f"За все время: {format_counts(await async_database.get_event_totals())}\n"
+    for title, days in PERIODS:
+        totals = await async_database.get_event_totals(since_day(days))
+        text += f"За {title}: {format_counts(totals)}\n"
+
+    for kind, title in ((EVENT_COMPLETE, "Чаще всего зачтены"), (EVENT_DECLINE, "Чаще всего отклонены")):
+        tasks = await async_database.get_top_tasks(kind, TOP_TASKS)
+        if tasks:
+            text += f"\n{title}:\n"
+            for task_id, task_text, count in tasks:
+                text += f"#{task_id} {(task_text or '(удалено)')[:50]}: {count}\n"
+
+    for title, days in PERIODS:
+        top_users = await async_database.get_period_leaderboard(since_day(days), TOP_USERS)
+        text += f"\nТоп за {title}:\n"
+        if not top_users:
+            text += "Пока пуст.\n"
+            continue
+        names = await user_cache.resolve(bot, [user_id for user_id, _ in top_users])
+        for idx, (user_id, score) in enumerate(top_users, start=1):
+            text += f"{idx}. {names.get(user_id, f'Пользователь @{user_id}')}: {score} заданий\n"
+
+    # Количество чатов не ограничено, поэтому они идут последними
+    # и при обрезке текста пропадают первыми.
+    chats = await async_database.get_chat_rollup()
+    if chats:
+        text += "\nПо чатам:\n"
+        for chat_id, counts in chats.items():
+            text += f"{chat_id}: {format_counts(counts)}\n"
+    return text[:limit]
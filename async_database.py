@@ -0,0 +1,393 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import database
+import task_import
+from config import DB_READERS
+from known_users import known_users
+from leaderboard import leaderboard
+from metrics import metrics
+from search_cache import search_cache
+from task_index import task_index
+from write_coalescer import WriteCoalescer
+
+# Все запросы к SQLite выполняются в отдельных потоках, чтобы
+# медленный commit не блокировал цикл событий бота. Запись идет через
+# единственный поток писателя, чтение — через потоки читателей.
+_writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_reader_executor = ThreadPoolExecutor(max_workers=DB_READERS, thread_name_prefix="db-reader")
+
+
+def _timed(func, conn, *args):
+    started = time.perf_counter()
+    try:
+        return func(conn, *args)
+    except Exception:
+        metrics.increment("db_query_errors_total", func.__name__)
+        raise
+    finally:
+        metrics.observe("db_query_seconds", func.__name__, time.perf_counter() - started)
+
+
+def _read(func, *args):
+    with database.pool.reader() as conn:
+        return _timed(func, conn, *args)
+
+
+def _write(func, *args):
+    with database.pool.writer() as conn:
+        return _timed(func, conn, *args)
+
+
+_coalescer = WriteCoalescer(_writer_executor, lambda: database.pool.writer(), call=_timed)
+
+
+async def run_read(func, *args):
+    """
+    Выполняет читающую функцию модуля database вне цикла событий.
+
+    :param func: Функция вида func(conn, *args).
+    :param args: Аргументы функции без соединения.
+    :return: Результат функции.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_reader_executor, partial(_read, func, *args))
+
+
+def _log_failed_write(future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"Deferred write failed: {future.exception()}")
+
+
+async def run_write(func, *args, durable=True):
+    """
+    Выполняет изменяющую функцию модуля database в потоке писателя.
+
+    Записи из параллельных обработчиков объединяются в общие транзакции,
+    поэтому функция должна выполнять только короткие изменения.
+
+    :param func: Функция вида func(conn, *args).
+    :param args: Аргументы функции без соединения.
+    :param durable: Дожидаться ли фиксации записи. Если False, запись
+        только ставится в очередь, а ошибка попадет в лог.
+    :return: Результат функции или None, если durable=False.
+    """
+    future = _coalescer.submit(func, *args)
+    if durable:
+        return await future
+    future.add_done_callback(_log_failed_write)
+
+
+async def run_exclusive(func, *args):
+    """
+    Выполняет изменяющую функцию в потоке писателя отдельно от пакетов
+    записей. Функция сама управляет транзакциями; подходит для миграций
+    и массового импорта.
+
+    :param func: Функция вида func(conn, *args).
+    :param args: Аргументы функции без соединения.
+    :return: Результат функции.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_writer_executor, partial(_write, func, *args))
+
+
+async def flush_writes():
+    """
+    Дожидается фиксации всех поставленных в очередь записей.
+    """
+    await _coalescer.drain()
+
+
+def shutdown():
+    """
+    Дожидается завершения запросов, останавливает потоки базы данных
+    и закрывает пул соединений.
+    """
+    _writer_executor.shutdown(wait=True)
+    _reader_executor.shutdown(wait=True)
+    database.close_pool()
+
+
+async def create_tables():
+    return await run_exclusive(database.create_tables)
+
+
+async def get_all_user_ids():
+    return await run_read(database.get_all_user_ids)
+
+
+async def load_known_users():
+    """
+    Загружает пользователей из таблицы статистики в множество известных.
+    """
+    known_users.load(await run_read(database.get_all_user_ids))
+
+
+async def add_user_to_stats(user_id):
+    """
+    Добавляет пользователя в статистику, если его там еще нет.
+
+    Уже известные пользователи не вызывают записи в базу данных.
+    Пользователь считается известным только после фиксации записи, поэтому
+    при ошибке следующая команда попробует добавить его снова. Пользователи,
+    добавленные другими процессами, при первой встрече проходят через
+    INSERT OR IGNORE, который ничего не меняет.
+
+    :param user_id: Идентификатор пользователя.
+    """
+    if user_id in known_users:
+        return
+    await run_write(database.add_user_to_stats, user_id)
+    known_users.add(user_id)
+    leaderboard.add_user(user_id)
+
+
+async def get_active_task(user_id):
+    return await run_read(database.get_active_task, user_id)
+
+
+async def load_task_index():
+    """
+    Загружает идентификаторы заданий в индекс случайного выбора.
+    """
+    task_index.load(await run_read(database.get_all_task_ids))
+
+
+async def sync_task_index():
+    """
+    Добавляет в индекс задания, созданные другими процессами.
+
+    Идентификаторы заданий растут монотонно, поэтому достаточно выбрать
+    задания с id больше последнего прочитанного из базы. Удаленные другими
+    процессами задания убираются из индекса при первой попытке их выдать.
+    """
+    task_ids = await run_read(database.get_task_ids_after, task_index.synced_id)
+    for task_id in task_ids:
+        task_index.add(task_id)
+    if task_ids:
+        task_index.synced_id = task_ids[-1]
+        search_cache.invalidate()
+
+
+async def add_task_to_user(user_id, task_id, deadline=None, chat_id=None):
+    return await run_write(database.add_task_to_user, user_id, task_id, deadline, chat_id)
+
+
+async def get_task_deadlines(after=None):
+    return await run_read(database.get_task_deadlines, after)
+
+
+async def get_user_tasks(user_ids):
+    return await run_read(database.get_user_tasks, user_ids)
+
+
+async def expire_user_tasks(tasks, now):
+    return await run_write(database.expire_user_tasks, tasks, now)
+
+
+async def update_user_stats(user_id, increment):
+    completed = await run_write(database.update_user_stats, user_id, increment)
+    if completed is not None:
+        leaderboard.set_score(user_id, completed)
+    return completed
+
+
+async def delete_task_from_user(user_id, task_id=None, chat_id=None):
+    return await run_write(database.delete_task_from_user, user_id, task_id, chat_id)
+
+
+async def complete_active_task(user_id, increment, chat_id=None):
+    """
+    Засчитывает или не засчитывает активное задание пользователя.
+
+    :param user_id: Идентификатор пользователя.
+    :param increment: Изменение количества выполненных заданий.
+    :param chat_id: Идентификатор чата, в котором проверено задание.
+    :return: Новое количество выполненных заданий или None, если активного задания нет.
+    """
+    completed = await run_write(database.complete_active_task, user_id, increment, chat_id)
+    if completed is not None:
+        leaderboard.set_score(user_id, completed)
+    return completed
+
+
+async def record_task_event(kind, user_id, task_id, chat_id=None):
+    """
+    Ставит событие задания в очередь записи, не дожидаясь фиксации.
+    """
+    await run_write(database.record_task_event, kind, user_id, task_id, chat_id, durable=False)
+
+
+async def get_event_totals(since_day=None):
+    return await run_read(database.get_event_totals, since_day)
+
+
+async def get_top_tasks(kind, limit=5):
+    return await run_read(database.get_top_tasks, kind, limit)
+
+
+async def get_chat_rollup():
+    return await run_read(database.get_chat_rollup)
+
+
+async def get_period_leaderboard(since_day, limit=10):
+    return await run_read(database.get_period_leaderboard, since_day, limit)
+
+
+async def get_user_stats(user_id):
+    return await run_read(database.get_user_stats, user_id)
+
+
+async def add_task(task_text: str):
+    task_id = await run_write(database.add_task, task_text)
+    if task_id is not None:
+        task_index.add(task_id)
+        search_cache.invalidate()
+    return task_id
+
+
+async def import_tasks(binary_stream, filename: str):
+    """
+    Импортирует задания из файла в потоке писателя и добавляет их в индекс.
+
+    Задания вставляются порциями в отдельных транзакциях, поэтому после
+    ошибки в середине файла уже зафиксированные порции тоже попадают
+    в индекс.
+
+    :param binary_stream: Двоичный поток с содержимым файла.
+    :param filename: Имя файла для определения формата.
+    :return: Кортеж (количество добавленных заданий, количество дубликатов).
+    :raises task_import.TaskImportError: Если файл прочитан не до конца.
+    """
+    max_id = await run_read(database.get_max_task_id)
+    try:
+        _, skipped = await run_exclusive(task_import.import_stream, binary_stream, filename)
+        error = None
+    except Exception as e:
+        error = e
+    # Задания других процессов с id больше max_id тоже попадут в индекс,
+    # как при sync_task_index.
+    task_ids = await run_read(database.get_task_ids_after, max_id)
+    for task_id in task_ids:
+        task_index.add(task_id)
+    search_cache.invalidate()
+    if error is not None:
+        raise task_import.TaskImportError(len(task_ids), error) from error
+    return len(task_ids), skipped
+
+
+async def delete_task(task_id: int):
+    await run_write(database.delete_task, task_id)
+    task_index.remove(task_id)
+    search_cache.invalidate()
+
+
+async def get_task_by_id(task_id: int):
+    return await run_read(database.get_task_by_id, task_id)
+
+
+async def search_tasks(text: str, limit: int = 20, offset: int = 0):
+    """
+    Ищет задания по словам, используя кэш повторяющихся запросов.
+
+    :param text: Строка поиска.
+    :param limit: Максимальное количество заданий.
+    :param offset: Количество пропускаемых заданий.
+    :return: Список кортежей (id, текст задания).
+    """
+    key = (" ".join(text.lower().split()), limit, offset)
+    result = search_cache.get(key)
+    if result is None:
+        result = await run_read(database.search_tasks, text, limit, offset)
+        search_cache.put(key, result)
+    return result
+
+
+async def get_seen_tasks(user_id):
+    return await run_read(database.get_seen_tasks, user_id)
+
+
+async def save_seen_tasks(user_id, seen: bytes):
+    # Карта только подсказывает, что выдавать; фиксации можно не ждать.
+    await run_write(database.save_seen_tasks, user_id, seen, durable=False)
+
+
+async def get_tasks_page(after_id: int = 0, limit: int = 10):
+    return await run_read(database.get_tasks_page, after_id, limit)
+
+
+async def get_tasks_page_before(before_id: int, limit: int = 10):
+    return await run_read(database.get_tasks_page_before, before_id, limit)
+
+
+async def get_all_tasks():
+    return await run_read(database.get_all_tasks)
+
+
+async def load_leaderboard():
+    """
+    Загружает статистику пользователей в рейтинг.
+    """
+    leaderboard.load(await run_read(database.get_all_user_stats))
+
+
+async def sync_leaderboard(since: float):
+    """
+    Применяет к рейтингу изменения статистики после указанного момента.
+
+    :param since: Время (unix time).
+    """
+    for user_id, completed in await run_read(database.get_user_stats_since, since):
+        leaderboard.set_score(user_id, completed)
+
+
+async def get_top_users(limit=10):
+    return await run_read(database.get_top_users, limit)
+
+
+async def upsert_users(users):
+    return await run_write(database.upsert_users, users)
+
+
+async def get_users(user_ids):
+    return await run_read(database.get_users, user_ids)
+
+
+async def get_media_file_id(url: str):
+    return await run_read(database.get_media_file_id, url)
+
+
+async def set_media_file_id(url: str, file_id):
+    return await run_write(database.set_media_file_id, url, file_id)
+
+
+async def save_broadcast(started_at: int, finished_at: int, deliveries):
+    return await run_write(database.save_broadcast, started_at, finished_at, deliveries)
+
+
+async def add_delayed_job(run_at: float, kind: str, payload: str):
+    return await run_write(database.add_delayed_job, run_at, kind, payload)
+
+
+async def get_delayed_jobs():
+    return await run_read(database.get_delayed_jobs)
+
+
+async def get_delayed_jobs_after(after_id: int):
+    return await run_read(database.get_delayed_jobs_after, after_id)
+
+
+async def delete_delayed_jobs(job_ids):
+    return await run_write(database.delete_delayed_jobs, job_ids)
+
+
+async def get_fsm_record(key: str):
+    return await run_read(database.get_fsm_record, key)
+
+
+async def save_fsm_records(upserts, deletes, purge_before=None):
+    return await run_write(database.save_fsm_records, upserts, deletes, purge_before)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+# Команды в порядке выполнения: /accept и decline используют
+# задания, взятые пользователями на шаге accept_callback.
+COMMANDS = ("task", "accept_callback", "accept_command", "decline_callback", "stats")
+
+
+def percentile(values, q: float) -> float:
+    """
+    Возвращает перцентиль отсортированного списка.
+
+    :param values: Отсортированный список значений.
+    :param q: Перцентиль от 0 до 100.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def seed(users: int, tasks: int):
+    """
+    Заполняет базу данных пользователями и заданиями, если их там меньше,
+    чем нужно. Повторный запуск на той же базе ничего не добавляет.
+
+    :param users: Количество пользователей.
+    :param tasks: Количество заданий.
+    """
+    import database
+
+    conn = database.create_connection()
+    try:
+        database.configure_connection(conn)
+        database.create_tables(conn)
+        cursor = conn.cursor()
+        now = time.time()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO user_stats (user_id, completed_tasks, updated_at) VALUES (?, ?, ?)",
+            ((user_id, random.randint(0, 50), now) for user_id in range(1, users + 1)),
+        )
+        conn.commit()
+        database.upsert_users(conn, [
+            (user_id, f"user{user_id}", f"User {user_id}", now) for user_id in range(1, users + 1)
+        ])
+        existing = cursor.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        if existing < tasks:
+            database.import_tasks(conn, (f"Задание №{number}" for number in range(existing, tasks)))
+    finally:
+        conn.close()
+
+
+async def run(args) -> dict:
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import TelegramMethod
+    from aiogram.types import Update
+
+    import bot as app
+    import fake_telegram
+    from config import ADMIN_IDS, CHATS
+    from loader import bot
+
+    class RecordingSession(BaseSession):
+        """
+        Сессия бота, которая не ходит в сеть: запросы записываются,
+        а ответы строятся заглушкой и разбираются так же, как ответы Telegram.
+        """
+
+        def __init__(self):
+            super().__init__()
+            self.requests = Counter()
+
+        async def make_request(self, bot, method, timeout=None):
+            self.requests[method.__api_method__] += 1
+            result = fake_telegram.fake_result(method.__api_method__, method.model_dump(exclude_none=True))
+            content = json.dumps({"ok": True, "result": result})
+            return self.check_response(bot=bot, method=method, status_code=200, content=content).result
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    # Планировщик отправки не подключается: ограничения Telegram измеряются
+    # нагрузочным тестом, а здесь — только обработчики и база данных.
+    session = RecordingSession()
+    bot.session = session
+
+    chat_id = CHATS[0]
+    admin_id = ADMIN_IDS[0]
+    update_ids = itertools.count(1)
+
+    def message(user_id, text, reply_to=None):
+        return {"update_id": next(update_ids), "message": fake_telegram.fake_message(chat_id, user_id, text, reply_to)}
+
+    def callback(user_id, data):
+        return {"update_id": next(update_ids), "callback_query": fake_telegram.fake_callback_query(chat_id, user_id, data)}
+
+    users = random.sample(range(1, args.users + 1), min(args.iterations, args.users))
+    task_ids = [random.randint(1, args.tasks) for _ in users]
+    updates = {
+        "task": [message(user_id, "/task") for user_id in users],
+        "accept_callback": [callback(user_id, f"accept:{user_id}:{task_id}") for user_id, task_id in zip(users, task_ids)],
+        "accept_command": [message(admin_id, "/accept", reply_to=user_id) for user_id in users[::2]],
+        "decline_callback": [callback(user_id, f"decline:{user_id}:{task_id}") for user_id, task_id in zip(users[1::2], task_ids[1::2])],
+        "stats": [message(user_id, "/stats") for user_id in users],
+    }
+
+    async def feed(update, latencies):
+        started = time.perf_counter()
+        result = await app.dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+        if isinstance(result, TelegramMethod):
+            await bot(result)
+        latencies.append(time.perf_counter() - started)
+
+    await app.on_startup(app.dp, run_jobs=False, metrics_port=0)
+    results = {}
+    try:
+        for command in args.commands:
+            session.requests.clear()
+            latencies = []
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def limited(update):
+                async with semaphore:
+                    await feed(update, latencies)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(limited(update) for update in updates[command]))
+            # Уведомления отправляются в фоне; их отправка входит во время команды.
+            await app.notification_queue.join()
+            elapsed = time.perf_counter() - started
+
+            latencies.sort()
+            results[command] = {
+                "updates": len(latencies),
+                "seconds": round(elapsed, 4),
+                "updates_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+                "requests": dict(session.requests),
+            }
+    finally:
+        await app.on_shutdown()
+    return results
+
+
+def main():
+    """Измеряет производительность обработчиков бота без Telegram"""
+    parser = argparse.ArgumentParser(description="Бенчмарк обработчиков бота с заглушкой Bot API.")
+    parser.add_argument("--database", default="benchmark.db", help="Файл базы данных для бенчмарка")
+    parser.add_argument("--users", type=int, default=100_000, help="Количество пользователей в базе")
+    parser.add_argument("--tasks", type=int, default=10_000, help="Количество заданий в базе")
+    parser.add_argument("--iterations", type=int, default=1000, help="Количество обновлений на команду")
+    parser.add_argument("--concurrency", type=int, default=50, help="Количество обновлений, обрабатываемых одновременно")
+    parser.add_argument("--commands", nargs="+", choices=COMMANDS, default=list(COMMANDS), help="Команды для измерения")
+    parser.add_argument("--output", default="benchmark.json", help="Файл для сохранения результатов в JSON")
+    parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора случайных чисел")
+    parser.add_argument(
+        "--throttle",
+        action="store_true",
+        help="Не отключать ограничение частоты команд; все обновления идут из одной группы, поэтому почти все будут отброшены",
+    )
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте config, поэтому окружение задается до импорта модулей бота.
+    os.environ["DATABASE_NAME"] = args.database
+    os.environ["WORKERS"] = "0"
+    # Все обновления идут из одной группы и упираются в лимиты на чат.
+    os.environ["THROTTLING"] = "1" if args.throttle else "0"
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("CHATS", "[-1001]")
+    os.environ.setdefault("ADMIN_IDS", "[1]")
+    random.seed(args.seed)
+
+    started = time.perf_counter()
+    seed(args.users, args.tasks)
+    print(f"База данных подготовлена за {time.perf_counter() - started:.1f} с")
+
+    results = asyncio.run(run(args))
+    for command, result in results.items():
+        print(
+            f"{command:18} {result['updates_per_sec']:>9} upd/s  "
+            f"p50 {result['p50_ms']:>8} мс  p99 {result['p99_ms']:>8} мс"
+        )
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "parameters": {
+            "users": args.users,
+            "tasks": args.tasks,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "throttle": args.throttle,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,110 @@
 from aiogram import Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 import asyncio
 import logging
 
-from database import create_connection, create_tables
+import async_database
+import database
+from config import BOT_MODE, METRICS_HOST, METRICS_PORT, THROTTLING, WORKERS
 from handlers import router
-from scheduler import daily_task
+from metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware, metrics, start_metrics_server
+from scheduler import schedule_daily_task
+from delayed_jobs import delayed_jobs
+from task_deadlines import task_deadlines
 from loader import bot 
+from sqlite_storage import SQLiteStorage
+from throttling import LIMITS, ThrottlingMiddleware
+from user_cache import UserCacheMiddleware, user_cache
+from notifications import notification_queue
+from send_scheduler import send_scheduler
+from webhook import run_webhook
+from workers import JOBS_POLL_INTERVAL, run_intake
 
 logging.basicConfig(level=logging.INFO)
 
-storage = MemoryStorage()
+storage = SQLiteStorage()
 dp = Dispatcher(storage=storage)
 
+dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+dp.update.outer_middleware(UserCacheMiddleware(user_cache))
+for observer in (router.message, router.callback_query, router.chat_member):
+    observer.middleware(HandlerMetricsMiddleware(metrics))
+throttling = ThrottlingMiddleware(LIMITS if THROTTLING else {})
+router.message.outer_middleware(throttling)
+router.callback_query.outer_middleware(throttling)
 dp.include_router(router)
 
-async def on_startup(dp: Dispatcher):
+metrics.gauge("send_queue_depth", send_scheduler.depth)
+metrics.gauge("notification_queue_size", lambda: {"notifications": notification_queue.qsize()})
+metrics_runner = None
+
+async def on_startup(dp: Dispatcher, run_jobs: bool = True, metrics_port: int = METRICS_PORT):
     """
     Функция, выполняемая при запуске бота.
 
-    Эта функция создает соединение с базой данных, 
-    создает необходимые таблицы и запускает 
-    запланированную задачу.
+    Эта функция открывает пул соединений с базой данных, 
+    создает необходимые таблицы, загружает индекс заданий, рейтинг
+    и известных пользователей, запускает очередь уведомлений
+    и отложенные задачи, включая рассылку по расписанию.
     
     :param dp: Диспетчер Aiogram.
+    :param run_jobs: Запускать ли обработчик отложенных задач. В режиме
+        нескольких процессов задачи выполняет только процесс приема обновлений.
+    :param metrics_port: Порт сервера метрик; 0 — сервер не запускается.
     """
-    conn = create_connection()
-    create_tables(conn)
-    conn.close()
+    global metrics_runner
+    database.open_pool()
+    await async_database.create_tables()
+    await async_database.load_task_index()
+    await async_database.load_leaderboard()
+    await async_database.load_known_users()
+
+    notification_queue.start(bot)
+    if run_jobs:
+        await delayed_jobs.load()
+        delayed_jobs.start(bot, poll_interval=JOBS_POLL_INTERVAL if WORKERS else None)
+        await schedule_daily_task()
+        await task_deadlines.load()
+        task_deadlines.start(poll_interval=JOBS_POLL_INTERVAL if WORKERS else None)
+    if metrics_port:
+        metrics_runner = await start_metrics_server(METRICS_HOST, metrics_port)
 
-    asyncio.create_task(daily_task(bot))
+async def on_shutdown():
+    """
+    Функция, выполняемая при остановке бота.
+
+    Останавливает отложенные задачи, отправляет оставшиеся уведомления,
+    сохраняет кэши, дожидается фиксации записей в базу данных
+    и закрывает сессию бота и пул соединений.
+    """
+    await delayed_jobs.stop()
+    await task_deadlines.stop()
+    await notification_queue.drain()
+    await user_cache.flush()
+    await bot.session.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await async_database.flush_writes()
+    async_database.shutdown()
 
 async def main():
     """
     Основная функция, запускающая бота.
 
     Эта функция вызывает функцию on_startup и 
-    начинает опрос бота для получения обновлений.
+    начинает получать обновления: опросом или через webhook,
+    в зависимости от BOT_MODE. Если WORKERS больше нуля, обновления
+    обрабатываются в отдельных процессах.
     """
     await on_startup(dp)
-    await dp.start_polling(bot) 
+    try:
+        if WORKERS:
+            await run_intake(dp, bot, WORKERS)
+        elif BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramNetworkError,
+    TelegramServerError,
+)
+
+import async_database
+from send_scheduler import BROADCAST, send_priority
+
+MAX_CONCURRENCY = 20
+MAX_ATTEMPTS = 3
+
+
+def _is_file_id_error(error) -> bool:
+    return isinstance(error, TelegramBadRequest) and "file" in error.message.lower()
+
+
+class Broadcaster:
+    """
+    Рассылка фотографии по многим чатам.
+
+    Фотография загружается по URL один раз, после чего во все чаты
+    отправляется полученный file_id. Чаты обрабатываются параллельно
+    с приоритетом рассылки в планировщике отправки, который соблюдает
+    лимиты Telegram и ожидает flood-wait. Сетевые ошибки повторяются,
+    а результат по каждому чату сохраняется в базе.
+    """
+
+    def __init__(self, bot: Bot, concurrency=MAX_CONCURRENCY):
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def _send(self, chat_id: int, photo: str, caption: str):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                message = await self.bot.send_photo(chat_id=str(chat_id), photo=photo, caption=caption)
+                return message, None, attempts
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempts >= MAX_ATTEMPTS:
+                    return None, e, attempts
+                await asyncio.sleep(2 ** attempts)
+            except Exception as e:
+                return None, e, attempts
+
+    async def _deliver(self, chat_id: int, photo: str, caption: str):
+        token = send_priority.set(BROADCAST)
+        try:
+            async with self.semaphore:
+                message, error, attempts = await self._send(chat_id, photo, caption)
+        finally:
+            send_priority.reset(token)
+        if error is not None:
+            logging.error(f"Failed to send broadcast to chat {chat_id}: {error}")
+        return chat_id, message, error, attempts
+
+    async def send_photo(self, chats, photo_url: str, caption: str):
+        """
+        Рассылает фотографию с подписью во все чаты.
+
+        :param chats: Список идентификаторов чатов.
+        :param photo_url: URL фотографии.
+        :param caption: Подпись к фотографии.
+        :return: Список кортежей (chat_id, ok, error, attempts).
+        """
+        started_at = int(time.time())
+        file_id = await async_database.get_media_file_id(photo_url)
+        cached = file_id is not None
+        results = []
+        pending = list(chats)
+
+        while pending:
+            if file_id is None:
+                # Пока file_id неизвестен, отправляем по одному чату: первая
+                # успешная отправка по URL дает file_id для всех остальных.
+                chat_id, message, error, attempts = await self._deliver(pending.pop(0), photo_url, caption)
+                results.append((chat_id, message, error, attempts))
+                if message is not None and message.photo:
+                    file_id = message.photo[-1].file_id
+                    await async_database.set_media_file_id(photo_url, file_id)
+                continue
+
+            delivered = await asyncio.gather(*(self._deliver(chat_id, file_id, caption) for chat_id in pending))
+            pending = []
+            for chat_id, message, error, attempts in delivered:
+                if cached and _is_file_id_error(error):
+                    pending.append(chat_id)
+                else:
+                    results.append((chat_id, message, error, attempts))
+            if pending:
+                # Сохраненный file_id устарел: загружаем фотографию заново.
+                file_id = None
+                cached = False
+                await async_database.set_media_file_id(photo_url, None)
+
+        rows = [(chat_id, error is None, None if error is None else str(error), attempts) for chat_id, _, error, attempts in results]
+        try:
+            await async_database.save_broadcast(started_at, int(time.time()), rows)
+        except Exception as e:
+            logging.error(f"Failed to save broadcast results: {e}")
+        delivered_count = sum(1 for row in rows if row[1])
+        logging.info(f"Broadcast delivered to {delivered_count}/{len(rows)} chats")
+        return rows
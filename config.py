@@ -7,3 +7,41 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHATS = [int(chat_id) for chat_id in os.getenv("CHATS").strip("[]").split(",")]
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 ADMIN_IDS = [int(admin_id) for admin_id in os.getenv("ADMIN_IDS").strip("[]").split(",")]
+
+DB_READERS = int(os.getenv("DB_READERS", 4))
+
+# Адрес Bot API; по умолчанию — серверы Telegram. Для нагрузочных тестов
+# можно указать локальную заглушку, например http://127.0.0.1:8081.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Режим получения обновлений: "polling" или "webhook".
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 100))
+# Сколько секунд запрос webhook ждет обработчик; дальше обработка
+# продолжается в фоне, а Telegram получает пустой ответ.
+WEBHOOK_RESPONSE_TIMEOUT = float(os.getenv("WEBHOOK_RESPONSE_TIMEOUT", 1.0))
+
+# Срок выполнения задания и время напоминания до его окончания в секундах;
+# TASK_REMINDER = 0 отключает напоминания.
+TASK_DEADLINE = int(os.getenv("TASK_DEADLINE", 24 * 60 * 60))
+TASK_REMINDER = int(os.getenv("TASK_REMINDER", 2 * 60 * 60))
+
+# Интервал рассылки по расписанию в секундах.
+BROADCAST_INTERVAL = int(os.getenv("BROADCAST_INTERVAL", 6 * 60 * 60))
+
+# THROTTLING=0 отключает ограничение частоты команд (throttling.py),
+# например для нагрузочного теста, где все обновления идут из одной группы.
+THROTTLING = os.getenv("THROTTLING", "1") != "0"
+
+# Количество процессов-обработчиков; 0 — все обновления обрабатываются в одном процессе.
+WORKERS = int(os.getenv("WORKERS", 0))
+
+# Порт HTTP-сервера метрик Prometheus; 0 — сервер не запускается.
+# Процессы-обработчики используют порты METRICS_PORT + 1, METRICS_PORT + 2 и т.д.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
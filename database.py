@@ -1,46 +1,392 @@
+import hashlib
+import queue
 import sqlite3
-from config import DATABASE_NAME
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
 
-def create_connection():
+from config import DATABASE_NAME, DB_READERS, TASK_DEADLINE
+
+def task_hash(task_text: str) -> str:
     """
-    Создает и возвращает соединение с базой данных.
+    Вычисляет хэш содержимого задания для поиска дубликатов.
 
-    :return: Объект соединения с базой данных SQLite.
+    Пробелы по краям и повторяющиеся пробелы внутри текста не учитываются.
+
+    :param task_text: Текст задания.
+    :return: Хэш SHA-256 в шестнадцатеричном виде.
     """
-    conn = sqlite3.connect(DATABASE_NAME)
-    return conn
+    normalized = " ".join(task_text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
 
-def create_tables(conn):
+def _backfill_task_hashes(cursor):
     """
-    Создает необходимые таблицы в базе данных, если они еще не существуют.
+    Заполняет content_hash у существующих заданий и удаляет дубликаты,
+    оставляя задание с наименьшим идентификатором.
+    """
+    kept = {}
+    duplicates = []
+    for task_id, task_text in cursor.execute("SELECT id, task_text FROM tasks ORDER BY id").fetchall():
+        content_hash = task_hash(task_text)
+        if content_hash in kept:
+            duplicates.append((kept[content_hash], task_id))
+        else:
+            kept[content_hash] = task_id
+            cursor.execute("UPDATE tasks SET content_hash = ? WHERE id = ?", (content_hash, task_id))
+    for kept_id, duplicate_id in duplicates:
+        cursor.execute("UPDATE user_tasks SET task_id = ? WHERE task_id = ?", (kept_id, duplicate_id))
+        cursor.execute("DELETE FROM tasks WHERE id = ?", (duplicate_id,))
 
-    :param conn: Объект соединения с базой данных.
+def _backfill_task_deadlines(cursor):
     """
-    cursor = conn.cursor()
+    Назначает уже выданным заданиям полный срок выполнения от момента
+    миграции: время их выдачи неизвестно.
+    """
+    now = time.time()
+    cursor.execute(
+        "UPDATE user_tasks SET assigned_at = ?, deadline = ? WHERE deadline IS NULL",
+        (now, now + TASK_DEADLINE),
+    )
 
-    cursor.execute("""
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция — список
+# DDL-запросов или функций от курсора; при запуске применяются только те,
+# что еще не выполнены.
+MIGRATIONS = [
+    [
+        """
         CREATE TABLE IF NOT EXISTS tasks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             task_text TEXT NOT NULL
         )
-    """)
-
-    cursor.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_tasks (
             user_id INTEGER PRIMARY KEY,
             task_id INTEGER,
             FOREIGN KEY (task_id) REFERENCES tasks (id)
         )
-    """)
-
-    cursor.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_stats (
             user_id INTEGER PRIMARY KEY,
             completed_tasks INTEGER DEFAULT 0
         )
-    """)
+        """,
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            updated_at INTEGER NOT NULL
+        )
+        """,
+    ],
+    [
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_stats_completed
+        ON user_stats (completed_tasks DESC)
+        """,
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS media_cache (
+            url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at INTEGER NOT NULL,
+            finished_at INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            delivered INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            broadcast_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            ok INTEGER NOT NULL,
+            error TEXT,
+            attempts INTEGER NOT NULL,
+            PRIMARY KEY (broadcast_id, chat_id),
+            FOREIGN KEY (broadcast_id) REFERENCES broadcasts (id)
+        )
+        """,
+    ],
+    [
+        "ALTER TABLE tasks ADD COLUMN content_hash TEXT",
+        _backfill_task_hashes,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_content_hash ON tasks (content_hash)",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS delayed_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_at REAL NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_delayed_jobs_run_at ON delayed_jobs (run_at)",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage (updated_at)",
+    ],
+    [
+        "ALTER TABLE user_stats ADD COLUMN updated_at REAL NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_user_stats_updated_at ON user_stats (updated_at)",
+    ],
+    [
+        "ALTER TABLE user_tasks ADD COLUMN assigned_at REAL",
+        "ALTER TABLE user_tasks ADD COLUMN deadline REAL",
+        _backfill_task_deadlines,
+        "CREATE INDEX IF NOT EXISTS idx_user_tasks_deadline ON user_tasks (deadline)",
+    ],
+    [
+        # Полнотекстовый индекс по заданиям; содержимое хранится только
+        # в tasks, а индекс обновляется триггерами.
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            task_text,
+            content='tasks',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, task_text) VALUES (new.id, new.task_text);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, task_text) VALUES ('delete', old.id, old.task_text);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF task_text ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, task_text) VALUES ('delete', old.id, old.task_text);
+            INSERT INTO tasks_fts (rowid, task_text) VALUES (new.id, new.task_text);
+        END
+        """,
+        "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS user_seen_tasks (
+            user_id INTEGER PRIMARY KEY,
+            seen BLOB NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ],
+    [
+        # Журнал событий заданий и агрегаты по нему; агрегаты обновляются
+        # в той же транзакции, что и запись события (см. _record_event).
+        """
+        CREATE TABLE IF NOT EXISTS task_events (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            chat_id INTEGER,
+            created_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS task_rollup (
+            task_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (task_id, kind)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_task_rollup_kind_count ON task_rollup (kind, count)",
+        """
+        CREATE TABLE IF NOT EXISTS chat_rollup (
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, kind)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            day TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, kind)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_daily_rollup (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+        """,
+    ],
+]
 
-    conn.commit()
+# Виды событий в task_events.
+EVENT_ASSIGN = "assign"
+EVENT_ACCEPT = "accept"
+EVENT_DECLINE = "decline"
+EVENT_COMPLETE = "complete"
+EVENT_REJECT = "reject"
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+def create_connection():
+    """
+    Создает и возвращает соединение с базой данных.
+
+    :return: Объект соединения с базой данных SQLite.
+    """
+    conn = sqlite3.connect(DATABASE_NAME)
+    return conn
+
+def configure_connection(conn):
+    """
+    Настраивает соединение для долгой работы: WAL, synchronous=NORMAL,
+    увеличенный кэш страниц и mmap.
+
+    :param conn: Объект соединения с базой данных.
+    :return: То же соединение.
+    """
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений: один писатель и несколько читателей.
+
+    Соединения открываются один раз и переиспользуются, поэтому
+    подготовленные запросы остаются в кэше sqlite3 между обновлениями.
+    """
+
+    def __init__(self, database=DATABASE_NAME, readers=DB_READERS):
+        self.readers = readers
+        self._writer = self._open(database)
+        self._writer_lock = threading.Lock()
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._open(database))
+
+    @staticmethod
+    def _open(database):
+        conn = sqlite3.connect(database, check_same_thread=False, cached_statements=256)
+        return configure_connection(conn)
+
+    @contextmanager
+    def reader(self):
+        """
+        Выдает соединение для чтения на время блока with.
+        """
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """
+        Выдает единственное соединение для записи на время блока with.
+        """
+        with self._writer_lock:
+            yield self._writer
+
+    def close(self):
+        """
+        Закрывает все соединения пула.
+        """
+        with self._writer_lock:
+            self._writer.close()
+        for _ in range(self.readers):
+            self._readers.get().close()
+
+pool = None
+
+def open_pool(readers=DB_READERS):
+    """
+    Открывает глобальный пул соединений, если он еще не открыт.
+
+    :param readers: Количество соединений для чтения.
+    :return: Пул соединений.
+    """
+    global pool
+    if pool is None:
+        pool = ConnectionPool(readers=readers)
+    return pool
+
+def close_pool():
+    """
+    Закрывает глобальный пул соединений.
+    """
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
+
+def create_tables(conn):
+    """
+    Создает необходимые таблицы в базе данных, если они еще не существуют.
+
+    Применяет только миграции, версия которых выше PRAGMA user_version,
+    поэтому на актуальной схеме DDL не выполняется. Каждая миграция
+    выполняется в отдельной транзакции вместе с обновлением user_version:
+    если она не удалась, схема остается в состоянии предыдущей версии.
+
+    :param conn: Объект соединения с базой данных.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+
+    cursor = conn.cursor()
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Без явного BEGIN модуль sqlite3 фиксирует каждую DDL-команду сразу.
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Миграцию мог уже применить другой процесс.
+            if cursor.execute("PRAGMA user_version").fetchone()[0] >= number:
+                conn.commit()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
 
 def get_all_user_ids(conn):
     """
@@ -61,7 +407,7 @@ def add_user_to_stats(conn, user_id):
     :param user_id: Идентификатор пользователя.
     """
     cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)", (user_id,))
+    cursor.execute("INSERT OR IGNORE INTO user_stats (user_id, updated_at) VALUES (?, ?)", (user_id, time.time()))
     conn.commit()
 
 def get_active_task(conn, user_id):
@@ -77,29 +423,29 @@ def get_active_task(conn, user_id):
     result = cursor.fetchone()
     return result
 
-def get_random_task(conn):
-    """
-    Получает случайное задание из таблицы заданий.
-
-    :param conn: Объект соединения с базой данных.
-    :return: Кортеж (id, текст задания) или None, если заданий нет.
-    """
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, task_text FROM tasks ORDER BY RANDOM() LIMIT 1")
-    task = cursor.fetchone()
-    return task
-
-def add_task_to_user(conn, user_id, task_id):
+def add_task_to_user(conn, user_id, task_id, deadline=None, chat_id=None):
     """
-    Присваивает задание пользователю.
+    Присваивает задание пользователю, если у него нет активного задания,
+    и записывает событие принятия задания.
 
     :param conn: Объект соединения с базой данных.
     :param user_id: Идентификатор пользователя.
     :param task_id: Идентификатор задания.
+    :param deadline: Срок выполнения (unix time) или None, если срока нет.
+    :param chat_id: Идентификатор чата, в котором принято задание.
+    :return: True, если задание присвоено.
     """
+    now = time.time()
     cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO user_tasks (user_id, task_id) VALUES (?, ?)", (user_id, task_id))
+    cursor.execute(
+        "INSERT OR IGNORE INTO user_tasks (user_id, task_id, assigned_at, deadline) VALUES (?, ?, ?, ?)",
+        (user_id, task_id, now, deadline),
+    )
+    assigned = cursor.rowcount > 0
+    if assigned:
+        _record_event(cursor, EVENT_ACCEPT, user_id, task_id, chat_id, now)
     conn.commit()
+    return assigned
 
 def update_user_stats(conn, user_id, increment):
     """
@@ -108,26 +454,277 @@ def update_user_stats(conn, user_id, increment):
     :param conn: Объект соединения с базой данных.
     :param user_id: Идентификатор пользователя.
     :param increment: Количество выполненных заданий для добавления или вычитания.
+    :return: Новое количество выполненных заданий или None, если пользователь не найден.
     """
     cursor = conn.cursor()
     cursor.execute("""
        UPDATE user_stats
-       SET completed_tasks = MAX(0, completed_tasks + ?)
+       SET completed_tasks = MAX(0, completed_tasks + ?), updated_at = ?
        WHERE user_id = ?
-    """, (increment, user_id))
+       RETURNING completed_tasks
+    """, (increment, time.time(), user_id))
+    result = cursor.fetchone()
     conn.commit()
+    return result[0] if result else None
 
-def delete_task_from_user(conn, user_id):
+def delete_task_from_user(conn, user_id, task_id=None, chat_id=None):
    """
-   Удаляет все задания у указанного пользователя.
+   Удаляет задания у указанного пользователя.
+
+   Если указано задание, снимается только оно, и в той же транзакции
+   записывается событие отказа от него: отказ от старого предложения
+   не должен снимать другое, уже принятое задание.
 
    :param conn: Объект соединения с базой данных.
    :param user_id: Идентификатор пользователя.
+   :param task_id: Идентификатор отклоненного задания или None, чтобы снять все задания.
+   :param chat_id: Идентификатор чата, в котором отклонено задание.
    """
    cursor = conn.cursor()
-   cursor.execute("DELETE FROM user_tasks WHERE user_id = ?", (user_id,))
+   if task_id is None:
+       cursor.execute("DELETE FROM user_tasks WHERE user_id = ?", (user_id,))
+   else:
+       cursor.execute("DELETE FROM user_tasks WHERE user_id = ? AND task_id = ?", (user_id, task_id))
+       _record_event(cursor, EVENT_DECLINE, user_id, task_id, chat_id, time.time())
    conn.commit()
 
+def complete_active_task(conn, user_id, increment, chat_id=None):
+    """
+    Снимает активное задание с пользователя, обновляет его статистику
+    и записывает событие зачета или незачета в одной транзакции.
+
+    :param conn: Объект соединения с базой данных.
+    :param user_id: Идентификатор пользователя.
+    :param increment: Количество выполненных заданий для добавления или вычитания.
+    :param chat_id: Идентификатор чата, в котором проверено задание.
+    :return: Новое количество выполненных заданий или None, если активного задания нет.
+    """
+    now = time.time()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM user_tasks WHERE user_id = ? RETURNING task_id", (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        conn.commit()
+        return None
+    cursor.execute("""
+       INSERT INTO user_stats (user_id, completed_tasks, updated_at) VALUES (?, MAX(0, ?), ?)
+       ON CONFLICT (user_id) DO UPDATE SET
+           completed_tasks = MAX(0, completed_tasks + ?),
+           updated_at = excluded.updated_at
+       RETURNING completed_tasks
+    """, (user_id, increment, now, increment))
+    completed = cursor.fetchone()[0]
+    _record_event(cursor, EVENT_COMPLETE if increment > 0 else EVENT_REJECT, user_id, row[0], chat_id, now)
+    conn.commit()
+    return completed
+
+def event_day(timestamp: float) -> str:
+    """
+    Возвращает день события в формате YYYY-MM-DD по местному времени.
+
+    :param timestamp: Время (unix time).
+    """
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+def _record_event(cursor, kind, user_id, task_id, chat_id, now):
+    """
+    Записывает событие в журнал и обновляет агрегаты. Вызывается внутри
+    транзакции изменения, к которому относится событие.
+    """
+    day = event_day(now)
+    cursor.execute(
+        "INSERT INTO task_events (kind, user_id, task_id, chat_id, created_at) VALUES (?, ?, ?, ?, ?)",
+        (kind, user_id, task_id, chat_id, now),
+    )
+    cursor.execute("""
+       INSERT INTO task_rollup (task_id, kind, count) VALUES (?, ?, 1)
+       ON CONFLICT (task_id, kind) DO UPDATE SET count = count + 1
+    """, (task_id, kind))
+    cursor.execute("""
+       INSERT INTO daily_rollup (day, kind, count) VALUES (?, ?, 1)
+       ON CONFLICT (day, kind) DO UPDATE SET count = count + 1
+    """, (day, kind))
+    if chat_id is not None:
+        cursor.execute("""
+           INSERT INTO chat_rollup (chat_id, kind, count) VALUES (?, ?, 1)
+           ON CONFLICT (chat_id, kind) DO UPDATE SET count = count + 1
+        """, (chat_id, kind))
+    if kind in (EVENT_COMPLETE, EVENT_REJECT):
+        completed, rejected = (1, 0) if kind == EVENT_COMPLETE else (0, 1)
+        cursor.execute("""
+           INSERT INTO user_daily_rollup (day, user_id, completed, rejected) VALUES (?, ?, ?, ?)
+           ON CONFLICT (day, user_id) DO UPDATE SET
+               completed = completed + excluded.completed,
+               rejected = rejected + excluded.rejected
+        """, (day, user_id, completed, rejected))
+
+def record_task_event(conn, kind, user_id, task_id, chat_id=None):
+    """
+    Записывает событие задания, не связанное с другими изменениями.
+
+    :param conn: Объект соединения с базой данных.
+    :param kind: Вид события, например EVENT_ASSIGN.
+    :param user_id: Идентификатор пользователя.
+    :param task_id: Идентификатор задания.
+    :param chat_id: Идентификатор чата или None.
+    """
+    _record_event(conn.cursor(), kind, user_id, task_id, chat_id, time.time())
+    conn.commit()
+
+def get_event_totals(conn, since_day=None):
+    """
+    Получает количество событий каждого вида по дневным агрегатам.
+
+    :param conn: Объект соединения с базой данных.
+    :param since_day: Первый учитываемый день (YYYY-MM-DD) или None для всего времени.
+    :return: Словарь {вид события: количество}.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT kind, SUM(count) FROM daily_rollup WHERE day >= ? GROUP BY kind",
+        (since_day or "",),
+    )
+    return dict(cursor.fetchall())
+
+def get_top_tasks(conn, kind, limit=5):
+    """
+    Получает задания с наибольшим количеством событий указанного вида.
+
+    :param conn: Объект соединения с базой данных.
+    :param kind: Вид события.
+    :param limit: Максимальное количество заданий.
+    :return: Список кортежей (task_id, текст задания или None, количество).
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+       SELECT r.task_id, t.task_text, r.count
+       FROM task_rollup r LEFT JOIN tasks t ON t.id = r.task_id
+       WHERE r.kind = ?
+       ORDER BY r.count DESC
+       LIMIT ?
+    """, (kind, limit))
+    return cursor.fetchall()
+
+def get_chat_rollup(conn):
+    """
+    Получает количество событий каждого вида по чатам.
+
+    :param conn: Объект соединения с базой данных.
+    :return: Словарь {chat_id: {вид события: количество}}.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT chat_id, kind, count FROM chat_rollup")
+    chats = {}
+    for chat_id, kind, count in cursor.fetchall():
+        chats.setdefault(chat_id, {})[kind] = count
+    return chats
+
+def get_period_leaderboard(conn, since_day: str, limit=10):
+    """
+    Возвращает топ пользователей по зачтенным заданиям начиная с указанного дня.
+
+    Очки считаются как зачтенные минус незачтенные задания
+    по агрегатам user_daily_rollup.
+
+    :param conn: Объект соединения с базой данных.
+    :param since_day: Первый учитываемый день (YYYY-MM-DD).
+    :param limit: Максимальное количество пользователей.
+    :return: Список кортежей (user_id, очки).
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+       SELECT user_id, SUM(completed) - SUM(rejected) AS score
+       FROM user_daily_rollup
+       WHERE day >= ?
+       GROUP BY user_id
+       HAVING score > 0
+       ORDER BY score DESC
+       LIMIT ?
+    """, (since_day, limit))
+    return cursor.fetchall()
+
+def get_task_deadlines(conn, after=None):
+    """
+    Получает сроки выполнения активных заданий по индексу deadline.
+
+    :param conn: Объект соединения с базой данных.
+    :param after: Если задано, только сроки позже этого момента (unix time).
+    :return: Список кортежей (deadline, user_id, task_id), отсортированный по сроку.
+    """
+    cursor = conn.cursor()
+    if after is None:
+        cursor.execute("SELECT deadline, user_id, task_id FROM user_tasks WHERE deadline IS NOT NULL ORDER BY deadline")
+    else:
+        cursor.execute("SELECT deadline, user_id, task_id FROM user_tasks WHERE deadline > ? ORDER BY deadline", (after,))
+    return cursor.fetchall()
+
+def get_user_tasks(conn, user_ids):
+    """
+    Получает активные задания пользователей.
+
+    :param conn: Объект соединения с базой данных.
+    :param user_ids: Идентификаторы пользователей.
+    :return: Словарь {user_id: (task_id, deadline)}.
+    """
+    if not user_ids:
+        return {}
+    placeholders = ", ".join("?" * len(user_ids))
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT user_id, task_id, deadline FROM user_tasks WHERE user_id IN ({placeholders})", list(user_ids))
+    return {user_id: (task_id, deadline) for user_id, task_id, deadline in cursor.fetchall()}
+
+def expire_user_tasks(conn, tasks, now):
+    """
+    Снимает с пользователей задания, срок которых истек.
+
+    Задание снимается, только если оно все еще активно и его срок
+    не позже now, поэтому уже выполненные или замененные задания
+    не затрагиваются.
+
+    :param conn: Объект соединения с базой данных.
+    :param tasks: Список кортежей (user_id, task_id).
+    :param now: Текущее время (unix time).
+    :return: Список кортежей (user_id, task_id) снятых заданий.
+    """
+    cursor = conn.cursor()
+    expired = []
+    for user_id, task_id in tasks:
+        cursor.execute(
+            "DELETE FROM user_tasks WHERE user_id = ? AND task_id = ? AND deadline <= ? RETURNING user_id, task_id",
+            (user_id, task_id, now),
+        )
+        expired.extend(cursor.fetchall())
+    conn.commit()
+    return expired
+
+def get_seen_tasks(conn, user_id):
+    """
+    Получает сжатую битовую карту заданий, которые уже выдавались пользователю.
+
+    :param conn: Объект соединения с базой данных.
+    :param user_id: Идентификатор пользователя.
+    :return: Байты карты или None, если пользователю еще ничего не выдавалось.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT seen FROM user_seen_tasks WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+def save_seen_tasks(conn, user_id, seen: bytes):
+    """
+    Сохраняет сжатую битовую карту выданных пользователю заданий.
+
+    :param conn: Объект соединения с базой данных.
+    :param user_id: Идентификатор пользователя.
+    :param seen: Байты карты.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO user_seen_tasks (user_id, seen, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET seen = excluded.seen, updated_at = excluded.updated_at
+    """, (user_id, seen, time.time()))
+    conn.commit()
+
 def get_user_stats(conn, user_id):
    """
    Получает статистику пользователя по количеству выполненных заданий.
@@ -147,10 +744,78 @@ def add_task(conn, task_text: str):
 
    :param conn: Объект соединения с базой данных.
    :param task_text: Текст задания для добавления в базу данных.
+   :return: Идентификатор добавленного задания или None, если такое
+       задание уже есть.
    """
    cursor = conn.cursor()
-   cursor.execute("INSERT INTO tasks (task_text) VALUES (?)", (task_text,))
+   cursor.execute("INSERT OR IGNORE INTO tasks (task_text, content_hash) VALUES (?, ?)", (task_text, task_hash(task_text)))
    conn.commit()
+   return cursor.lastrowid if cursor.rowcount == 1 else None
+
+def import_tasks(conn, task_texts, chunk_size: int = 1000):
+   """
+   Массово добавляет задания, пропуская дубликаты.
+
+   Задания читаются из итератора порциями; каждая порция вставляется
+   одним executemany в одной транзакции.
+
+   :param conn: Объект соединения с базой данных.
+   :param task_texts: Итерируемый набор текстов заданий.
+   :param chunk_size: Количество заданий в одной транзакции.
+   :return: Кортеж (список идентификаторов добавленных заданий,
+       количество пропущенных дубликатов).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT COALESCE(MAX(id), 0) FROM tasks")
+   max_id = cursor.fetchone()[0]
+   total = 0
+   inserted = 0
+
+   task_texts = iter(task_texts)
+   while True:
+       chunk = [(task_text, task_hash(task_text)) for task_text in islice(task_texts, chunk_size)]
+       if not chunk:
+           break
+       cursor.executemany("INSERT OR IGNORE INTO tasks (task_text, content_hash) VALUES (?, ?)", chunk)
+       conn.commit()
+       total += len(chunk)
+       inserted += cursor.rowcount
+
+   cursor.execute("SELECT id FROM tasks WHERE id > ? ORDER BY id", (max_id,))
+   task_ids = [row[0] for row in cursor.fetchall()]
+   return task_ids, total - inserted
+
+def fts_query(text: str) -> str:
+   """
+   Преобразует строку поиска в запрос FTS5: каждое слово ищется
+   как префикс, все слова должны встретиться в задании.
+
+   :param text: Строка поиска.
+   :return: Запрос для MATCH или пустая строка, если слов нет.
+   """
+   words = "".join(char if char.isalnum() else " " for char in text).split()
+   return " ".join(f'"{word}"*' for word in words)
+
+def search_tasks(conn, text: str, limit: int = 20, offset: int = 0):
+   """
+   Ищет задания по словам через полнотекстовый индекс tasks_fts.
+
+   :param conn: Объект соединения с базой данных.
+   :param text: Строка поиска; пустая строка — последние добавленные задания.
+   :param limit: Максимальное количество заданий.
+   :param offset: Количество пропускаемых заданий.
+   :return: Список кортежей (id, текст задания), новые задания первыми.
+   """
+   query = fts_query(text)
+   cursor = conn.cursor()
+   if query:
+       cursor.execute(
+           "SELECT rowid, task_text FROM tasks_fts WHERE tasks_fts MATCH ? ORDER BY rowid DESC LIMIT ? OFFSET ?",
+           (query, limit, offset),
+       )
+   else:
+       cursor.execute("SELECT id, task_text FROM tasks ORDER BY id DESC LIMIT ? OFFSET ?", (limit, offset))
+   return cursor.fetchall()
 
 def delete_task(conn, task_id: int):
    """
@@ -176,6 +841,74 @@ def get_task_by_id(conn, task_id: int):
    result = cursor.fetchone()
    return result[0] if result else None
 
+def get_all_task_ids(conn):
+   """
+   Получает идентификаторы всех заданий.
+
+   :param conn: Объект соединения с базой данных.
+   :return: Список идентификаторов заданий.
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT id FROM tasks")
+   return [row[0] for row in cursor.fetchall()]
+
+def get_max_task_id(conn):
+   """
+   Получает наибольший идентификатор задания.
+
+   :param conn: Объект соединения с базой данных.
+   :return: Идентификатор задания или 0, если заданий нет.
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT COALESCE(MAX(id), 0) FROM tasks")
+   return cursor.fetchone()[0]
+
+def get_task_ids_after(conn, after_id: int):
+   """
+   Получает идентификаторы заданий, добавленных после указанного.
+
+   :param conn: Объект соединения с базой данных.
+   :param after_id: Идентификатор задания.
+   :return: Список идентификаторов заданий.
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT id FROM tasks WHERE id > ? ORDER BY id", (after_id,))
+   return [row[0] for row in cursor.fetchall()]
+
+def get_tasks_page(conn, after_id: int = 0, limit: int = 10):
+   """
+   Получает страницу заданий с идентификаторами больше after_id.
+
+   :param conn: Объект соединения с базой данных.
+   :param after_id: Идентификатор последнего задания предыдущей страницы.
+   :param limit: Размер страницы.
+   :return: Кортеж (список (id, начало текста), есть ли предыдущая страница,
+       есть ли следующая страница).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT id, substr(task_text, 1, 10) FROM tasks WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit + 1))
+   rows = cursor.fetchall()
+   cursor.execute("SELECT EXISTS (SELECT 1 FROM tasks WHERE id <= ?)", (after_id,))
+   has_prev = bool(cursor.fetchone()[0])
+   return rows[:limit], has_prev, len(rows) > limit
+
+def get_tasks_page_before(conn, before_id: int, limit: int = 10):
+   """
+   Получает страницу заданий с идентификаторами меньше before_id.
+
+   :param conn: Объект соединения с базой данных.
+   :param before_id: Идентификатор первого задания следующей страницы.
+   :param limit: Размер страницы.
+   :return: Кортеж (список (id, начало текста), есть ли предыдущая страница,
+       есть ли следующая страница).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT id, substr(task_text, 1, 10) FROM tasks WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit + 1))
+   rows = cursor.fetchall()
+   cursor.execute("SELECT EXISTS (SELECT 1 FROM tasks WHERE id >= ?)", (before_id,))
+   has_next = bool(cursor.fetchone()[0])
+   return rows[:limit][::-1], len(rows) > limit, has_next
+
 def get_all_tasks(conn):
    """
    Получает все задания из таблицы заданий.
@@ -187,6 +920,29 @@ def get_all_tasks(conn):
    cursor.execute("SELECT id, task_text FROM tasks")
    return cursor.fetchall()
 
+def get_all_user_stats(conn):
+   """
+   Получает статистику всех пользователей.
+
+   :param conn: Объект соединения с базой данных.
+   :return: Список кортежей (user_id, completed_tasks).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT user_id, completed_tasks FROM user_stats")
+   return cursor.fetchall()
+
+def get_user_stats_since(conn, since: float):
+   """
+   Получает статистику пользователей, изменившуюся после указанного момента.
+
+   :param conn: Объект соединения с базой данных.
+   :param since: Время (unix time).
+   :return: Список кортежей (user_id, completed_tasks).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT user_id, completed_tasks FROM user_stats WHERE updated_at > ?", (since,))
+   return cursor.fetchall()
+
 def get_top_users(conn, limit=10):
      """
      Возвращает топ пользователей по количеству выполненных заданий.
@@ -199,3 +955,172 @@ def get_top_users(conn, limit=10):
      cursor.execute("SELECT user_id, completed_tasks FROM user_stats ORDER BY completed_tasks DESC LIMIT ?", (limit,))
      top_users = cursor.fetchall()
      return top_users
+
+def upsert_users(conn, users):
+   """
+   Сохраняет или обновляет профили пользователей.
+
+   :param conn: Объект соединения с базой данных.
+   :param users: Список кортежей (user_id, username, first_name, updated_at).
+   """
+   cursor = conn.cursor()
+   cursor.executemany("""
+       INSERT INTO users (user_id, username, first_name, updated_at)
+       VALUES (?, ?, ?, ?)
+       ON CONFLICT (user_id) DO UPDATE SET
+           username = excluded.username,
+           first_name = excluded.first_name,
+           updated_at = excluded.updated_at
+   """, users)
+   conn.commit()
+
+def get_users(conn, user_ids):
+   """
+   Получает сохраненные профили пользователей.
+
+   :param conn: Объект соединения с базой данных.
+   :param user_ids: Список идентификаторов пользователей.
+   :return: Список кортежей (user_id, username, first_name).
+   """
+   if not user_ids:
+       return []
+   placeholders = ", ".join("?" * len(user_ids))
+   cursor = conn.cursor()
+   cursor.execute(f"SELECT user_id, username, first_name FROM users WHERE user_id IN ({placeholders})", list(user_ids))
+   return cursor.fetchall()
+
+def get_media_file_id(conn, url: str):
+   """
+   Получает сохраненный file_id загруженного в Telegram файла.
+
+   :param conn: Объект соединения с базой данных.
+   :param url: Исходный URL файла.
+   :return: file_id или None, если файл еще не загружался.
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT file_id FROM media_cache WHERE url = ?", (url,))
+   result = cursor.fetchone()
+   return result[0] if result else None
+
+def set_media_file_id(conn, url: str, file_id):
+   """
+   Сохраняет file_id загруженного файла или удаляет его, если file_id равен None.
+
+   :param conn: Объект соединения с базой данных.
+   :param url: Исходный URL файла.
+   :param file_id: file_id, полученный от Telegram, или None.
+   """
+   cursor = conn.cursor()
+   if file_id is None:
+       cursor.execute("DELETE FROM media_cache WHERE url = ?", (url,))
+   else:
+       cursor.execute("INSERT OR REPLACE INTO media_cache (url, file_id) VALUES (?, ?)", (url, file_id))
+   conn.commit()
+
+def save_broadcast(conn, started_at: int, finished_at: int, deliveries):
+   """
+   Сохраняет итоги рассылки и результат доставки по каждому чату.
+
+   :param conn: Объект соединения с базой данных.
+   :param started_at: Время начала рассылки (unix time).
+   :param finished_at: Время окончания рассылки (unix time).
+   :param deliveries: Список кортежей (chat_id, ok, error, attempts).
+   :return: Идентификатор рассылки.
+   """
+   cursor = conn.cursor()
+   delivered = sum(1 for _, ok, _, _ in deliveries if ok)
+   cursor.execute(
+       "INSERT INTO broadcasts (started_at, finished_at, total, delivered) VALUES (?, ?, ?, ?)",
+       (started_at, finished_at, len(deliveries), delivered),
+   )
+   broadcast_id = cursor.lastrowid
+   cursor.executemany(
+       "INSERT INTO broadcast_deliveries (broadcast_id, chat_id, ok, error, attempts) VALUES (?, ?, ?, ?, ?)",
+       [(broadcast_id, chat_id, ok, error, attempts) for chat_id, ok, error, attempts in deliveries],
+   )
+   conn.commit()
+   return broadcast_id
+
+def add_delayed_job(conn, run_at: float, kind: str, payload: str):
+   """
+   Сохраняет отложенную задачу.
+
+   :param conn: Объект соединения с базой данных.
+   :param run_at: Время запуска (unix time).
+   :param kind: Вид задачи.
+   :param payload: Данные задачи в JSON.
+   :return: Идентификатор задачи.
+   """
+   cursor = conn.cursor()
+   cursor.execute("INSERT INTO delayed_jobs (run_at, kind, payload) VALUES (?, ?, ?)", (run_at, kind, payload))
+   conn.commit()
+   return cursor.lastrowid
+
+def get_delayed_jobs(conn):
+   """
+   Получает все запланированные задачи в порядке времени запуска.
+
+   :param conn: Объект соединения с базой данных.
+   :return: Список кортежей (run_at, id, kind, payload).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT run_at, id, kind, payload FROM delayed_jobs ORDER BY run_at")
+   return cursor.fetchall()
+
+def get_delayed_jobs_after(conn, after_id: int):
+   """
+   Получает задачи, добавленные после указанной.
+
+   :param conn: Объект соединения с базой данных.
+   :param after_id: Идентификатор задачи.
+   :return: Список кортежей (run_at, id, kind, payload).
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT run_at, id, kind, payload FROM delayed_jobs WHERE id > ? ORDER BY id", (after_id,))
+   return cursor.fetchall()
+
+def delete_delayed_jobs(conn, job_ids):
+   """
+   Удаляет выполненные задачи.
+
+   :param conn: Объект соединения с базой данных.
+   :param job_ids: Список идентификаторов задач.
+   """
+   cursor = conn.cursor()
+   cursor.executemany("DELETE FROM delayed_jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+   conn.commit()
+
+def get_fsm_record(conn, key: str):
+   """
+   Получает состояние FSM по ключу.
+
+   :param conn: Объект соединения с базой данных.
+   :param key: Ключ хранилища.
+   :return: Кортеж (state, data в JSON, updated_at) или None.
+   """
+   cursor = conn.cursor()
+   cursor.execute("SELECT state, data, updated_at FROM fsm_storage WHERE key = ?", (key,))
+   return cursor.fetchone()
+
+def save_fsm_records(conn, upserts, deletes, purge_before=None):
+   """
+   Записывает пачку изменений состояний FSM одной транзакцией.
+
+   :param conn: Объект соединения с базой данных.
+   :param upserts: Список кортежей (key, state, data в JSON, updated_at).
+   :param deletes: Список ключей для удаления.
+   :param purge_before: Если задано, удаляет записи, не менявшиеся с этого времени.
+   """
+   cursor = conn.cursor()
+   cursor.executemany("""
+       INSERT INTO fsm_storage (key, state, data, updated_at)
+       VALUES (?, ?, ?, ?)
+       ON CONFLICT (key) DO UPDATE SET
+           state = excluded.state,
+           data = excluded.data,
+           updated_at = excluded.updated_at
+   """, upserts)
+   cursor.executemany("DELETE FROM fsm_storage WHERE key = ?", [(key,) for key in deletes])
+   if purge_before is not None:
+       cursor.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (purge_before,))
+   conn.commit()
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import json
+import logging
+import time
+
+from aiogram import Bot
+
+import async_database
+
+
+class DelayedJobs:
+    """
+    Планировщик отложенных задач с хранением в SQLite.
+
+    Задачи записываются в таблицу delayed_jobs и держатся в куче по
+    времени запуска. Единственный фоновый обработчик ждет ближайшую
+    задачу, забирает все наступившие задачи пачкой, удаляет их из базы
+    одним запросом и выполняет. После перезапуска задачи загружаются
+    из базы, а просроченные выполняются сразу.
+    """
+
+    def __init__(self, batch_size=100):
+        self.batch_size = batch_size
+        self.bot = None
+        self._handlers = {}
+        self._heap = []
+        self._wakeup = None
+        self._task = None
+        self._running = set()
+        # Курсор опроса двигают только load() и _poll(): задачи других
+        # процессов могут получить id меньше, чем у только что
+        # запланированной здесь задачи.
+        self._polled_id = 0
+        self._local_ids = set()
+        self.poll_interval = None
+
+    def handler(self, kind: str):
+        """
+        Регистрирует обработчик задач указанного вида.
+
+        Обработчик вызывается как handler(bot, payload).
+
+        :param kind: Вид задачи.
+        """
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def pending(self, kind: str) -> int:
+        """
+        Возвращает количество запланированных задач указанного вида.
+
+        :param kind: Вид задачи.
+        """
+        return sum(1 for _, _, job_kind, _ in self._heap if job_kind == kind)
+
+    async def schedule(self, kind: str, delay: float, payload=None) -> int:
+        """
+        Планирует задачу.
+
+        :param kind: Вид задачи.
+        :param delay: Задержка в секундах от текущего момента.
+        :param payload: Данные задачи, сериализуемые в JSON.
+        :return: Идентификатор задачи.
+        """
+        run_at = time.time() + delay
+        payload = json.dumps(payload or {})
+        job_id = await async_database.add_delayed_job(run_at, kind, payload)
+        if self._task is not None:
+            if self.poll_interval is not None:
+                self._local_ids.add(job_id)
+            self._push(run_at, job_id, kind, payload)
+        return job_id
+
+    def _push(self, run_at, job_id, kind, payload):
+        heapq.heappush(self._heap, (run_at, job_id, kind, payload))
+        if self._wakeup is not None and self._heap[0][1] == job_id:
+            self._wakeup.set()
+
+    async def load(self):
+        """
+        Загружает запланированные задачи из базы данных.
+        """
+        self._heap = await async_database.get_delayed_jobs()
+        heapq.heapify(self._heap)
+        self._polled_id = max((job_id for _, job_id, _, _ in self._heap), default=self._polled_id)
+        self._local_ids = set()
+
+    async def _poll(self):
+        rows = await async_database.get_delayed_jobs_after(self._polled_id)
+        for run_at, job_id, kind, payload in rows:
+            if job_id in self._local_ids:
+                continue
+            self._push(run_at, job_id, kind, payload)
+        if rows:
+            self._polled_id = rows[-1][1]
+        # Свои задачи, уже выполненные и удаленные до опроса, опрос не вернет.
+        self._local_ids = {job_id for job_id in self._local_ids if job_id > self._polled_id}
+
+    def start(self, bot: Bot, poll_interval=None):
+        """
+        Запускает фоновый обработчик задач.
+
+        Пока обработчик не запущен, schedule() только записывает задачи
+        в базу. Если задачи планируют другие процессы, задайте
+        poll_interval: раз в столько секунд обработчик будет забирать
+        из базы новые задачи.
+
+        :param bot: Экземпляр бота Aiogram.
+        :param poll_interval: Интервал опроса базы в секундах или None.
+        """
+        self.bot = bot
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает обработчик; невыполненные задачи остаются в базе.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self.poll_interval is not None:
+                try:
+                    await self._poll()
+                except Exception as e:
+                    logging.error(f"Failed to poll delayed jobs: {e}")
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if self.poll_interval is not None and (delay is None or delay > self.poll_interval):
+                delay = self.poll_interval
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._heap))
+            try:
+                await async_database.delete_delayed_jobs([job_id for _, job_id, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Failed to remove {len(batch)} delayed jobs: {e}")
+            for _, job_id, kind, payload in batch:
+                task = asyncio.create_task(self._execute(job_id, kind, payload))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _execute(self, job_id: int, kind: str, payload: str):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            logging.error(f"No handler for delayed job {job_id} of kind {kind}")
+            return
+        try:
+            await handler(self.bot, json.loads(payload))
+        except Exception as e:
+            logging.error(f"Delayed job {job_id} ({kind}) failed: {e}")
+
+
+delayed_jobs = DelayedJobs()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+# Бот, от имени которого отвечает заглушка Bot API.
+BOT_INFO = {"id": 123456, "is_bot": True, "first_name": "Bastet", "username": "bastet_task_bot"}
+
+# Методы, которые возвращают отправленное или измененное сообщение.
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "editMessageText", "editMessageReplyMarkup"}
+
+# Методы, для которых сервер-заглушка может вернуть ошибку 429.
+LIMITED_METHODS = MESSAGE_METHODS | {"answerCallbackQuery", "deleteMessage"}
+
+_message_ids = itertools.count(1)
+
+
+def fake_chat(chat_id) -> dict:
+    """
+    Возвращает описание чата: отрицательные идентификаторы — группы,
+    положительные — личные чаты.
+
+    :param chat_id: Идентификатор чата.
+    :return: Словарь в формате объекта Chat.
+    """
+    chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0
+    if chat_id < 0:
+        return {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"}
+    return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+
+
+def fake_result(api_method: str, params: dict):
+    """
+    Возвращает правдоподобный результат метода Bot API без обращения к Telegram.
+
+    :param api_method: Имя метода Bot API, например "sendMessage".
+    :param params: Параметры запроса.
+    :return: Значение поля result ответа Bot API.
+    """
+    if api_method in MESSAGE_METHODS:
+        message = {
+            "message_id": int(params.get("message_id") or next(_message_ids)),
+            "date": int(time.time()),
+            "chat": fake_chat(params.get("chat_id")),
+            "from": BOT_INFO,
+        }
+        if api_method == "sendPhoto":
+            file_id = f"photo-{message['message_id']}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 720}]
+            message["caption"] = params.get("caption")
+        else:
+            message["text"] = params.get("text") or ""
+        return message
+    if api_method == "getChat":
+        return dict(fake_chat(params.get("chat_id")), accent_color_id=0, max_reaction_count=11)
+    if api_method == "getMe":
+        return BOT_INFO
+    if api_method == "getUpdates":
+        return []
+    return True
+
+
+def fake_message(chat_id: int, user_id: int, text: str, reply_to: int = None) -> dict:
+    """
+    Возвращает сообщение пользователя в группе.
+
+    :param chat_id: Идентификатор группы.
+    :param user_id: Идентификатор автора.
+    :param text: Текст; команды размечаются как bot_command.
+    :param reply_to: Идентификатор пользователя, на сообщение которого дан ответ.
+    :return: Словарь в формате объекта Message.
+    """
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if reply_to is not None:
+        message["reply_to_message"] = fake_message(chat_id, reply_to, "/task")
+    return message
+
+
+def fake_callback_query(chat_id: int, user_id: int, data: str) -> dict:
+    """
+    Возвращает нажатие кнопки под сообщением бота в группе.
+
+    :param chat_id: Идентификатор группы.
+    :param user_id: Идентификатор пользователя, нажавшего кнопку.
+    :param data: Данные кнопки.
+    :return: Словарь в формате объекта CallbackQuery.
+    """
+    return {
+        "id": str(next(_message_ids)),
+        "chat_instance": str(chat_id),
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+        "message": dict(fake_message(chat_id, BOT_INFO["id"], "Ваше задание"), **{"from": BOT_INFO}),
+        "data": data,
+    }
+
+
+class FakeBotAPI:
+    """
+    Сервер-заглушка Bot API для нагрузочных тестов.
+
+    Отвечает на запросы бота с заданной задержкой, с вероятностью
+    retry_rate возвращает ошибку 429 и раздает через getUpdates
+    обновления, добавленные запросом POST /_push.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, retry_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_rate = retry_rate
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.retries = Counter()
+        self.delivery_lags = deque(maxlen=100_000)
+        self._updates = deque()
+        self._update_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+
+    def push(self, updates):
+        """
+        Добавляет обновления в очередь getUpdates, присваивая им update_id.
+
+        :param updates: Список словарей в формате Update без update_id.
+        """
+        now = time.monotonic()
+        for update in updates:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append((update, now))
+        self._new_updates.set()
+
+    async def get_updates(self, offset: int, limit: int, timeout: float):
+        while self._updates and self._updates[0][0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        now = time.monotonic()
+        batch = list(itertools.islice(self._updates, limit))
+        for _, pushed_at in batch:
+            self.delivery_lags.append(now - pushed_at)
+        return [update for update, _ in batch]
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        api_method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.requests[api_method] += 1
+
+        if api_method == "getUpdates":
+            result = await self.get_updates(
+                int(params.get("offset") or 0),
+                int(params.get("limit") or 100),
+                float(params.get("timeout") or 0),
+            )
+            return web.json_response({"ok": True, "result": result})
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if api_method in LIMITED_METHODS and random.random() < self.retry_rate:
+            self.retries[api_method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        return web.json_response({"ok": True, "result": fake_result(api_method, params)})
+
+    async def handle_push(self, request: web.Request) -> web.Response:
+        updates = await request.json()
+        self.push(updates)
+        return web.json_response({"ok": True, "pending": len(self._updates)})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        lags = sorted(self.delivery_lags)
+        return web.json_response({
+            "pending": len(self._updates),
+            "requests": dict(self.requests),
+            "retries": dict(self.retries),
+            "delivery_lag_p50_ms": round(lags[len(lags) // 2] * 1000, 3) if lags else 0.0,
+            "delivery_lag_p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 3) if lags else 0.0,
+        })
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        app.router.add_post("/_push", self.handle_push)
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+
+def main():
+    """Запускает сервер-заглушку Bot API"""
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API для нагрузочных тестов.")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=8081, help="Порт")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа в секундах")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Случайное отклонение задержки в секундах")
+    parser.add_argument("--retry-rate", type=float, default=0.0, help="Доля запросов, на которые возвращается 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Значение retry_after в ответах 429")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    api = FakeBotAPI(args.latency, args.jitter, args.retry_rate, args.retry_after)
+    logging.info(f"Fake Bot API: set TELEGRAM_API_URL=http://{args.host}:{args.port}")
+    web.run_app(api.create_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
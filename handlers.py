@@ -1,31 +1,42 @@
-import asyncio
 from aiogram import Router, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.enums import ChatType
 from aiogram import types
 from aiogram.filters import ChatMemberUpdatedFilter, IS_NOT_MEMBER, MEMBER
+from aiogram.exceptions import TelegramBadRequest
 
 
-from database import (
-    create_connection,
+from async_database import (
     add_user_to_stats,
     get_active_task,
-    get_random_task,
-    add_task_to_user,
-    get_top_users,
-    update_user_stats,
     delete_task_from_user,
-    get_user_stats,
+    complete_active_task,
     add_task,
+    import_tasks,
     delete_task,
     get_task_by_id,
-    get_all_tasks,
+    get_tasks_page,
+    get_tasks_page_before,
+    search_tasks,
+    record_task_event,
 )
+from database import EVENT_ASSIGN
 from loader import bot
 from config import CHATS, ADMIN_IDS
+from user_cache import user_cache
+from leaderboard import leaderboard
+from notifications import notification_queue
+from task_index import task_index
+from seen_tasks import seen_tasks
+from delayed_jobs import delayed_jobs
+from task_deadlines import task_deadlines
+from single_flight import callback_flights, user_locks
+from metrics import metrics
+from task_import import TaskImportError
+from analytics import render_analytics
 
 router = Router()
 
@@ -48,9 +59,7 @@ class AdminFilter:
 @router.message(Command("start"), F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
 async def start(message: types.Message):
     user_id = message.from_user.id
-    conn = create_connection()
-    add_user_to_stats(conn, user_id)
-    conn.close()
+    await add_user_to_stats(user_id)
     
     await message.reply("Привет! Я бот для выдачи заданий. Используй /task, чтобы получить задание.")
 
@@ -60,22 +69,20 @@ async def get_task(message: types.Message, state: FSMContext):
         return
     user_id = message.from_user.id
 
-    conn = create_connection()
-    add_user_to_stats(conn, user_id)
+    await add_user_to_stats(user_id)
 
-    if get_active_task(conn, user_id):
+    if await get_active_task(user_id):
         await message.reply("У вас уже есть активное задание.")
-        conn.close()
         return
     
-    task = get_random_task(conn)
+    task = await seen_tasks.draw(user_id)
     
     if not task:
         await message.reply("Задания закончились.")
-        conn.close()
         return
     
     task_id, task_text = task
+    await record_task_event(EVENT_ASSIGN, user_id, task_id, message.chat.id)
     
     accept_button = InlineKeyboardButton(text="Принять", callback_data=f"accept:{user_id}:{task_id}")
     decline_button = InlineKeyboardButton(text="Отказаться", callback_data=f"decline:{user_id}:{task_id}")
@@ -84,42 +91,69 @@ async def get_task(message: types.Message, state: FSMContext):
     
     await message.reply(f"Ваше задание: {task_text}\nОтчет отправлять @Miss_Bastet5", reply_markup=keyboard)
     await state.set_state(TaskState.waiting_for_task)
-    conn.close()
     
 @router.callback_query(lambda c: c.data.startswith(('accept:', 'decline:')))
 async def process_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    # Двойные нажатия и одновременные нажатия одной кнопки обрабатываются
+    # один раз, остальные получают тот же ответ без запросов к базе и API.
+    message = callback_query.message
+    key = (message.chat.id, message.message_id, callback_query.data) if message else callback_query.data
+    text, duplicate = await callback_flights.do(key, lambda: handle_task_callback(callback_query, state))
+    if duplicate:
+        logging.info(f"Duplicate callback {callback_query.data} from user {callback_query.from_user.id}")
+        # Ответ на callback возвращается диспетчеру: при работе через webhook
+        # он уходит в ответе на запрос Telegram без отдельного вызова API.
+        return callback_query.answer(text)
+    # Сначала отвечаем на нажатие: редактирование сообщения в группе ждет
+    # лимита 20 сообщений в минуту и может не успеть до таймаута callback.
+    await callback_query.answer(text)
+    if message:
+        await message.edit_text(text)
+
+async def handle_task_callback(callback_query: types.CallbackQuery, state: FSMContext) -> str:
     action, user_id, task_id = callback_query.data.split(":")
     
     user_id = int(user_id)
     task_id = int(task_id)
-    
-    conn = create_connection()
+    chat_id = callback_query.message.chat.id if callback_query.message else None
     
     if action == "accept":
-        add_task_to_user(conn, user_id, task_id)
-        tsk = get_task_by_id(conn, task_id)
-        user = await bot.get_chat(user_id)
-        username = user.username if user.username else user.first_name
-        try:
-            await bot.send_message(user_id, f"Ваше задание {tsk}\nОтчет отправлять @Miss_Bastet5")
-            for chat_id in ADMIN_IDS:
-                try:
-                    await bot.send_message(str(chat_id), f"Пользователь @{username} взял задание {tsk}")
-                except Exception as e:
-                    print(e)
-                    continue
-        except:
-            await bot.send_message(chat_id=callback_query.message.chat.id, text=f"Ваше задание {tsk}\nОтчет отправлять @Miss_Bastet5. Чтобы в будущем задания дублировались - нажмите кнопку 'старт' боту @bastet_task_bot")
-        await callback_query.answer("Задание принято! Теперь вы можете его выполнять.")
-        await callback_query.message.edit_text("Задание принято! Теперь вы можете его выполнять.")
-    elif action == "decline":
-        delete_task_from_user(conn, user_id)
-        await callback_query.answer("Задание отклонено.")
-    
-        await callback_query.message.edit_text("Задание отклонено.")
+        async with user_locks.lock(user_id):
+            assigned = await task_deadlines.assign(user_id, task_id, chat_id)
+        if assigned:
+            notification_queue.defer(
+                lambda: task_taken_notifications(user_id, task_id, chat_id),
+                f"user {user_id} about task {task_id}",
+            )
+            text = "Задание принято! Теперь вы можете его выполнять."
+        else:
+            # Принято старое предложение, а у пользователя уже есть другое задание.
+            text = "У вас уже есть активное задание."
+    else:
+        async with user_locks.lock(user_id):
+            await delete_task_from_user(user_id, task_id, chat_id)
+        text = "Задание отклонено."
     
     await state.clear()
-    conn.close()
+    return text
+
+async def task_taken_notifications(user_id: int, task_id: int, chat_id: int = None):
+    """
+    Готовит уведомления о взятом задании для пользователя и администраторов.
+
+    Текст задания и имя пользователя запрашиваются уже в очереди
+    уведомлений, а не до ответа на нажатие кнопки.
+    """
+    tsk = await get_task_by_id(task_id)
+    names = await user_cache.resolve(bot, [user_id])
+    username = names.get(user_id, user_id)
+    fallback = None
+    if chat_id is not None:
+        fallback = (chat_id, f"Ваше задание {tsk}\nОтчет отправлять @Miss_Bastet5. Чтобы в будущем задания дублировались - нажмите кнопку 'старт' боту @bastet_task_bot")
+    notifications = [(user_id, f"Ваше задание {tsk}\nОтчет отправлять @Miss_Bastet5", fallback)]
+    for admin_id in ADMIN_IDS:
+        notifications.append((admin_id, f"Пользователь @{username} взял задание {tsk}", None))
+    return notifications
 
 @router.message(Command("addtask"), AdminFilter(), F.chat.type == ChatType.PRIVATE)
 async def add_task_command(message: types.Message, state: FSMContext):
@@ -129,73 +163,167 @@ async def add_task_command(message: types.Message, state: FSMContext):
 @router.message(TaskState.waiting_for_new_task, F.text, F.chat.type == ChatType.PRIVATE)
 async def process_new_task(message: types.Message, state: FSMContext):
     logging.info(f"User {message.from_user.id} submitted a new task: {message.text}")
-    conn = create_connection()
     try:
-        add_task(conn, message.text)
-        await message.reply("Задание успешно добавлено.")
-        logging.info(f"Task '{message.text}' added successfully.")
+        if await add_task(message.text) is None:
+            await message.reply("Такое задание уже есть.")
+        else:
+            await message.reply("Задание успешно добавлено.")
+            logging.info(f"Task '{message.text}' added successfully.")
     except Exception as e:
         logging.error(f"Error adding task: {e}")
         await message.reply("Произошла ошибка при добавлении задания.")
     finally:
-        conn.close()
+        await state.clear()
+        
+@router.message(Command("metrics"), AdminFilter(), F.chat.type == ChatType.PRIVATE)
+async def metrics_command(message: types.Message):
+    await message.reply(metrics.render_summary())
+
+@router.message(Command("analytics"), AdminFilter(), F.chat.type == ChatType.PRIVATE)
+async def analytics_command(message: types.Message):
+    await message.reply(await render_analytics(bot))
+
+@router.message(F.document, AdminFilter(), F.chat.type == ChatType.PRIVATE)
+async def import_tasks_document(message: types.Message, state: FSMContext):
+    logging.info(f"User {message.from_user.id} uploaded task file {message.document.file_name}")
+    try:
+        file = await bot.download(message.document)
+        added, skipped = await import_tasks(file, message.document.file_name or "")
+        await message.reply(f"Добавлено заданий: {added}, пропущено дубликатов: {skipped}.")
+    except TaskImportError as e:
+        logging.error(f"Error importing tasks: {e}")
+        await message.reply(f"Импорт прерван ошибкой в файле. Добавлено заданий до ошибки: {e.added}.")
+    except Exception as e:
+        logging.error(f"Error importing tasks: {e}")
+        await message.reply("Произошла ошибка при импорте заданий.")
+    finally:
         await state.clear()
         
 @router.message(Command("deletetask"), AdminFilter(), F.chat.type == ChatType.PRIVATE)
 async def delete_task_command(message: types.Message, state: FSMContext):
-    await show_tasks_for_deletion(message.from_user.id, 0)
+    await show_tasks_for_deletion(message.from_user.id)
     await state.set_state(TaskState.waiting_for_task_to_delete)
 
-async def show_tasks_for_deletion(user_id: int, page: int):
-    conn = create_connection()
-    tasks = get_all_tasks(conn)
+TASKS_PER_PAGE = 10
+
+def deletion_text() -> str:
+    return f"Выберите задание для удаления (всего заданий: {len(task_index)}):"
+
+async def build_deletion_keyboard(after_id: int = 0, before_id: int = None) -> InlineKeyboardMarkup:
+    """
+    Строит страницу списка заданий для удаления.
 
-    tasks_per_page = 10
-    total_pages = (len(tasks) + tasks_per_page - 1) // tasks_per_page
-    start_index = page * tasks_per_page
-    end_index = start_index + tasks_per_page
+    Страницы выбираются по курсору на tasks.id: after_id — следующая
+    страница после указанного задания, before_id — предыдущая страница.
+    """
+    if before_id is None:
+        tasks, has_prev, has_next = await get_tasks_page(after_id, TASKS_PER_PAGE)
+        if not tasks and has_prev:
+            # Последнее задание на странице удалено — показываем предыдущую.
+            tasks, has_prev, has_next = await get_tasks_page_before(after_id + 1, TASKS_PER_PAGE)
+    else:
+        tasks, has_prev, has_next = await get_tasks_page_before(before_id, TASKS_PER_PAGE)
 
-    buttons = []
-    for task in tasks[start_index:end_index]:
-        task_id, task_text = task
-        buttons.append([InlineKeyboardButton(text=task_text[:10], callback_data=f"delete_task:{task_id}")])
+    anchor = tasks[0][0] - 1 if tasks else 0
+    buttons = [[InlineKeyboardButton(text="Поиск", switch_inline_query_current_chat="")]]
+    for task_id, task_text in tasks:
+        buttons.append([InlineKeyboardButton(text=task_text, callback_data=f"delete_task:{task_id}:{anchor}")])
 
     nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="Назад", callback_data=f"delete_page:{page - 1}"))
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton(text="Вперед", callback_data=f"delete_page:{page + 1}"))
+    if has_prev:
+        nav_buttons.append(InlineKeyboardButton(text="Назад", callback_data=f"delete_page:prev:{tasks[0][0]}"))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton(text="Вперед", callback_data=f"delete_page:next:{tasks[-1][0]}"))
 
     if nav_buttons:
         buttons.append(nav_buttons)
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def show_tasks_for_deletion(user_id: int):
+    keyboard = await build_deletion_keyboard()
+    await bot.send_message(user_id, deletion_text(), reply_markup=keyboard)
 
-    await bot.send_message(user_id, "Выберите задание для удаления:", reply_markup=keyboard)
-    conn.close()
+async def edit_unless_unchanged(request):
+    """
+    Выполняет редактирование сообщения, пропуская ошибку Telegram
+    "message is not modified": при повторном нажатии кнопки новая
+    страница может совпасть с уже показанной.
+    """
+    try:
+        await request
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
 
 @router.callback_query(lambda c: c.data.startswith(('delete_task:', 'delete_page:')))
 async def process_delete_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    action, data = callback_query.data.split(":")
+    action, data = callback_query.data.split(":", 1)
 
     if action == "delete_task":
-        task_id = int(data)
-        conn = create_connection()
-        task_text = get_task_by_id(conn, task_id)
+        task_id, _, anchor = data.partition(":")
+        task_id = int(task_id)
+        task_text = await get_task_by_id(task_id)
 
         if task_text:
-            delete_task(conn, task_id)
+            await delete_task(task_id)
             await callback_query.answer(f"Задание '{task_text}' успешно удалено.")
         else:
             await callback_query.answer("Задание с таким ID не найдено.")
 
-        conn.close()
-        await show_tasks_for_deletion(callback_query.from_user.id, 0)  # Обновляем список заданий
+        # Обновляем текущую страницу в том же сообщении
+        keyboard = await build_deletion_keyboard(after_id=int(anchor or 0))
+        await edit_unless_unchanged(callback_query.message.edit_text(deletion_text(), reply_markup=keyboard))
 
     elif action == "delete_page":
-        page = int(data)
-        await show_tasks_for_deletion(callback_query.from_user.id, page)
+        direction, _, cursor = data.partition(":")
+        if direction == "prev":
+            keyboard = await build_deletion_keyboard(before_id=int(cursor))
+        elif direction == "next":
+            keyboard = await build_deletion_keyboard(after_id=int(cursor))
+        else:
+            # Кнопки старого формата delete_page:<номер> открывают первую страницу
+            keyboard = await build_deletion_keyboard()
         await callback_query.answer()
+        await edit_unless_unchanged(callback_query.message.edit_reply_markup(reply_markup=keyboard))
+
+
+SEARCH_RESULTS = 20
+
+@router.inline_query(AdminFilter())
+async def search_tasks_inline(inline_query: types.InlineQuery):
+    offset = int(inline_query.offset or 0)
+    tasks = await search_tasks(inline_query.query, SEARCH_RESULTS, offset)
+    results = [
+        InlineQueryResultArticle(
+            id=str(task_id),
+            title=task_text[:100],
+            description=f"Задание #{task_id}",
+            input_message_content=InputTextMessageContent(message_text=f"Задание #{task_id}:\n{task_text}"),
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="Удалить", callback_data=f"delete_found:{task_id}")]
+            ]),
+        )
+        for task_id, task_text in tasks
+    ]
+    next_offset = str(offset + len(tasks)) if len(tasks) == SEARCH_RESULTS else ""
+    return inline_query.answer(results, cache_time=5, is_personal=True, next_offset=next_offset)
+
+@router.callback_query(lambda c: c.data.startswith('delete_found:'), AdminFilter())
+async def process_found_delete_callback(callback_query: types.CallbackQuery):
+    task_id = int(callback_query.data.split(":", 1)[1])
+    if await get_task_by_id(task_id):
+        await delete_task(task_id)
+        text = f"Задание #{task_id} удалено."
+    else:
+        text = "Задание с таким ID не найдено."
+
+    await callback_query.answer(text)
+    # Сообщение, отправленное через inline-режим, редактируется по inline_message_id.
+    if callback_query.inline_message_id:
+        await edit_unless_unchanged(bot.edit_message_text(text, inline_message_id=callback_query.inline_message_id))
+    elif callback_query.message:
+        await edit_unless_unchanged(callback_query.message.edit_text(text))
 
 
 @router.message(Command("accept"), AdminFilter(), F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
@@ -205,50 +333,32 @@ async def accept_task(message: types.Message):
         return
     
     user_id = message.reply_to_message.from_user.id
-    conn = create_connection()
     
-    active_task = get_active_task(conn, user_id)
-    if not active_task:
+    async with user_locks.lock(user_id):
+        completed = await complete_active_task(user_id, 1, message.chat.id)
+    if completed is None:
         await message.reply("У пользователя нет активного задания.")
-        conn.close()
         return
     
-    update_user_stats(conn, user_id, 1)
-    
-    delete_task_from_user(conn, user_id)
-    
     await message.reply(f"Задание зачтено. Пользователь {message.reply_to_message.from_user.first_name} получил +1 к выполненным заданиям.")
-    await bot.send_message(user_id, "Ваше задание зачтено. Статистика обновлена.")
-    
-    conn.close()
+    notification_queue.notify(user_id, "Ваше задание зачтено. Статистика обновлена.")
     
     
 @router.message(Command("stats"), F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
 async def stats_command(message: types.Message):
     
     user_id = message.from_user.id
-    conn = create_connection()
     
-    completed_tasks = get_user_stats(conn, user_id)
-    personal_stats = f"Ваша статистика: {completed_tasks} выполненных заданий.\n\n"
+    completed_tasks = leaderboard.score(user_id)
+    personal_stats = f"Ваша статистика: {completed_tasks} выполненных заданий.\n"
+    rank = leaderboard.rank(user_id)
+    if rank:
+        personal_stats += f"Ваше место в рейтинге: #{rank}.\n"
+    personal_stats += "\n"
     
-    top_users = get_top_users(conn)
-    if top_users:
-        top_stats = "Топ-10 пользователей:\n"
-        for idx, (user_id, tasks) in enumerate(top_users, start=1):
-            try:
-                user = await bot.get_chat(user_id)
-                username = user.username if user.username else user.first_name
-                top_stats += f"{idx}. {username}: {tasks} заданий\n"
-            except Exception as e:
-                logging.error(f"Ошибка при получении информации о пользователе {user_id}: {e}")
-                top_stats += f"{idx}. Пользователь @{user_id}: {tasks} заданий\n"
-    else:
-        top_stats = "Топ пользователей пока пуст.\n"
+    top_stats = await leaderboard.render(bot)
     
     await message.reply(personal_stats + top_stats)
-    
-    conn.close()
 
 
 @router.message(Command("decline"), AdminFilter(), F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
@@ -258,21 +368,15 @@ async def decline_task(message: types.Message):
         return
     
     user_id = message.reply_to_message.from_user.id
-    conn = create_connection()
     
-    active_task = get_active_task(conn, user_id)
-    if not active_task:
+    async with user_locks.lock(user_id):
+        completed = await complete_active_task(user_id, -1, message.chat.id)
+    if completed is None:
         await message.reply("У пользователя нет активного задания.")
-        conn.close()
         return
     
-    update_user_stats(conn, user_id, -1)
-    delete_task_from_user(conn, user_id)
-    
     await message.reply(f"Задание не зачтено. Пользователь {message.reply_to_message.from_user.first_name} получает -1 балл.")
-    await bot.send_message(user_id, "Ваше задание не зачтено.")
-    
-    conn.close()
+    notification_queue.notify(user_id, "Ваше задание не зачтено.")
 
 @router.chat_member(ChatMemberUpdatedFilter(IS_NOT_MEMBER >> MEMBER))
 async def on_user_joined(event: types.ChatMemberUpdated):
@@ -288,5 +392,8 @@ async def on_user_joined(event: types.ChatMemberUpdated):
 
 ‼️ На выполнение дается 24 часа, в заданиях есть ФИНДОМ""")
         
-        await asyncio.sleep(300)
-        await bot.delete_message(chat_id, message.message_id)
\ No newline at end of file
+        await delayed_jobs.schedule("delete_message", 300, {"chat_id": chat_id, "message_id": message.message_id})
+
+@delayed_jobs.handler("delete_message")
+async def delete_message_job(bot, payload: dict):
+    await bot.delete_message(payload["chat_id"], payload["message_id"])
\ No newline at end of file
@@ -0,0 +1,54 @@
+from array import array
+from bisect import bisect_left
+
+# Сколько новых пользователей копится в множестве, прежде чем
+# они переносятся в отсортированный массив.
+MERGE_THRESHOLD = 4096
+
+
+class KnownUsers:
+    """
+    Множество пользователей, уже записанных в user_stats.
+
+    Основная часть идентификаторов хранится в отсортированном массиве
+    (8 байт на пользователя) и проверяется двоичным поиском, новые —
+    в небольшом множестве, которое периодически вливается в массив.
+    Множество только растет: пользователи из user_stats не удаляются.
+    """
+
+    def __init__(self):
+        self._sorted = array("q")
+        self._recent = set()
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def __contains__(self, user_id: int):
+        if user_id in self._recent:
+            return True
+        position = bisect_left(self._sorted, user_id)
+        return position < len(self._sorted) and self._sorted[position] == user_id
+
+    def load(self, user_ids):
+        """
+        Заполняет множество заново.
+
+        :param user_ids: Итерируемый набор идентификаторов пользователей.
+        """
+        self._sorted = array("q", sorted(set(user_ids)))
+        self._recent = set()
+
+    def add(self, user_id: int):
+        """
+        Добавляет пользователя.
+
+        :param user_id: Идентификатор пользователя.
+        """
+        if user_id in self:
+            return
+        self._recent.add(user_id)
+        if len(self._recent) >= MERGE_THRESHOLD:
+            self.load(list(self._sorted) + list(self._recent))
+
+
+known_users = KnownUsers()
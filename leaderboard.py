@@ -0,0 +1,129 @@
+import time
+from bisect import bisect_left, insort
+
+from aiogram import Bot
+
+# Готовый текст топа перестраивается не реже, чем раз в RENDER_TTL секунд,
+# чтобы подхватывать смену имен пользователей.
+RENDER_TTL = 5 * 60
+
+
+class Leaderboard:
+    """
+    Рейтинг пользователей по количеству выполненных заданий в памяти.
+
+    Счета хранятся в словаре, а порядок — в отсортированном списке
+    ключей (-completed_tasks, user_id), поэтому обновление счета, место
+    пользователя и топ-N не требуют полного прохода по user_stats.
+    Текст топа кэшируется и перестраивается только при изменении топа.
+    """
+
+    def __init__(self, size=10):
+        self.size = size
+        self._scores = {}
+        self._order = []
+        self._rendered = None
+        self._rendered_at = 0.0
+
+    def load(self, rows):
+        """
+        Заполняет рейтинг заново.
+
+        :param rows: Итерируемый набор кортежей (user_id, completed_tasks).
+        """
+        self._scores = dict(rows)
+        self._order = sorted((-completed, user_id) for user_id, completed in self._scores.items())
+        self._rendered = None
+
+    def add_user(self, user_id: int):
+        """
+        Добавляет пользователя с нулевым счетом, если его еще нет в рейтинге.
+
+        :param user_id: Идентификатор пользователя.
+        """
+        if user_id not in self._scores:
+            self.set_score(user_id, 0)
+
+    def set_score(self, user_id: int, completed: int):
+        """
+        Обновляет счет пользователя.
+
+        :param user_id: Идентификатор пользователя.
+        :param completed: Новое количество выполненных заданий.
+        """
+        old = self._scores.get(user_id)
+        if old == completed:
+            return
+        if old is not None:
+            position = bisect_left(self._order, (-old, user_id))
+            del self._order[position]
+            if position < self.size:
+                self._rendered = None
+        self._scores[user_id] = completed
+        insort(self._order, (-completed, user_id))
+        if bisect_left(self._order, (-completed, user_id)) < self.size:
+            self._rendered = None
+
+    def score(self, user_id: int) -> int:
+        """
+        Возвращает количество выполненных заданий пользователя.
+
+        :param user_id: Идентификатор пользователя.
+        :return: Количество выполненных заданий или 0, если пользователя нет.
+        """
+        return self._scores.get(user_id, 0)
+
+    def rank(self, user_id: int):
+        """
+        Возвращает место пользователя в рейтинге.
+
+        Пользователи с одинаковым счетом делят одно место.
+
+        :param user_id: Идентификатор пользователя.
+        :return: Место, начиная с 1, или None, если пользователя нет.
+        """
+        completed = self._scores.get(user_id)
+        if completed is None:
+            return None
+        return bisect_left(self._order, (-completed,)) + 1
+
+    def top(self):
+        """
+        Возвращает топ пользователей.
+
+        :return: Список кортежей (user_id, completed_tasks).
+        """
+        return [(user_id, -negative) for negative, user_id in self._order[:self.size]]
+
+    async def render(self, bot: Bot) -> str:
+        """
+        Возвращает готовый текст топа пользователей.
+
+        :param bot: Экземпляр бота Aiogram для получения имен.
+        :return: Текст блока с топом.
+        """
+        if self._rendered is not None and time.monotonic() - self._rendered_at < RENDER_TTL:
+            return self._rendered
+
+        # user_cache импортирует async_database, который импортирует этот модуль.
+        from user_cache import user_cache
+
+        top_users = self.top()
+        if top_users:
+            top_stats = f"Топ-{self.size} пользователей:\n"
+            names = await user_cache.resolve(bot, [user_id for user_id, _ in top_users])
+            for idx, (user_id, tasks) in enumerate(top_users, start=1):
+                if user_id in names:
+                    top_stats += f"{idx}. {names[user_id]}: {tasks} заданий\n"
+                else:
+                    top_stats += f"{idx}. Пользователь @{user_id}: {tasks} заданий\n"
+        else:
+            top_stats = "Топ пользователей пока пуст.\n"
+
+        if top_users == self.top():
+            self._rendered = top_stats
+            self._rendered_at = time.monotonic()
+        return top_stats
+
+
+leaderboard = Leaderboard()
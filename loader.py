@@ -1,4 +1,13 @@
-from config import BOT_TOKEN
+from config import BOT_TOKEN, TELEGRAM_API_URL
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-bot = Bot(token=BOT_TOKEN)
\ No newline at end of file
+from metrics import ApiMetricsMiddleware, metrics
+from send_scheduler import send_scheduler
+
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
+bot.session.middleware(send_scheduler)
+# Регистрируется после планировщика, чтобы измерять только сам запрос без ожидания очереди.
+bot.session.middleware(ApiMetricsMiddleware(metrics))
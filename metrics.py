@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+# Границы корзин гистограмм в секундах.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя метки для каждой метрики; у метрик, которых здесь нет, метка называется name.
+LABEL_NAMES = {
+    "bot_update_seconds": "update_type",
+    "bot_update_errors_total": "update_type",
+    "bot_handler_seconds": "handler",
+    "bot_handler_errors_total": "handler",
+    "db_query_seconds": "query",
+    "db_query_errors_total": "query",
+    "telegram_api_seconds": "method",
+    "telegram_api_errors_total": "method",
+    "bot_throttled_total": "command",
+    "send_queue_depth": "priority",
+    "notification_queue_size": "queue",
+}
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с фиксированными корзинами.
+    """
+
+    __slots__ = ("counts", "count", "sum", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """
+        Учитывает одно измерение.
+
+        :param seconds: Длительность в секундах.
+        """
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценивает квантиль по верхней границе корзины.
+
+        :param q: Квантиль от 0 до 1.
+        :return: Оценка в секундах; для последней корзины — бесконечность.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Реестр метрик бота: гистограммы длительностей, счетчики ошибок
+    и датчики, значения которых вычисляются при выводе.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, label: str) -> Histogram:
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name: str, label: str, seconds: float):
+        self.histogram(name, label).observe(seconds)
+
+    def increment(self, name: str, label: str, value: int = 1):
+        with self._lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+
+    def gauge(self, name: str, func: Callable[[], Dict[str, float]]):
+        """
+        Регистрирует датчик.
+
+        :param name: Имя метрики.
+        :param func: Функция без аргументов, возвращающая словарь {метка: значение}.
+        """
+        self.gauges[name] = func
+
+    def render_prometheus(self) -> str:
+        """
+        Возвращает метрики в текстовом формате Prometheus.
+        """
+        lines = []
+        current = None
+        for (name, label), histogram in sorted(self.histograms.items()):
+            if name != current:
+                current = name
+                lines.append(f"# TYPE {name} histogram")
+            key = LABEL_NAMES.get(name, "name")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{key}="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{key}="{label}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{{key}="{label}"}} {histogram.count}')
+        for (name, label), value in sorted(self.counters.items()):
+            if name != current:
+                current = name
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f'{name}{{{LABEL_NAMES.get(name, "name")}="{label}"}} {value}')
+        for name, func in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for label, value in func().items():
+                lines.append(f'{name}{{{LABEL_NAMES.get(name, "name")}="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def render_summary(self, limit: int = 4000) -> str:
+        """
+        Возвращает краткую сводку для команды /metrics.
+
+        :param limit: Максимальная длина текста.
+        """
+        lines = []
+        current = None
+        for (name, label), histogram in sorted(self.histograms.items()):
+            if name != current:
+                current = name
+                lines.append(f"\n{name}:")
+            lines.append(
+                f"{label}: {histogram.count} шт., "
+                f"p50 {histogram.quantile(0.5) * 1000:g} мс, p99 {histogram.quantile(0.99) * 1000:g} мс"
+            )
+        if self.counters:
+            lines.append("\nОшибки:")
+            for (name, label), value in sorted(self.counters.items()):
+                lines.append(f"{name} {label}: {value}")
+        for name, func in sorted(self.gauges.items()):
+            values = ", ".join(f"{label}={value}" for label, value in func().items())
+            lines.append(f"\n{name}: {values}")
+        text = "\n".join(lines).strip() or "Метрик пока нет."
+        return text[:limit]
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware: длительность обработки обновлений по типу и ошибки.
+    """
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.increment("bot_update_errors_total", event_type)
+            raise
+        finally:
+            self.registry.observe("bot_update_seconds", event_type, time.perf_counter() - started)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: длительность и ошибки каждого обработчика.
+    """
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.increment("bot_handler_errors_total", name)
+            raise
+        finally:
+            self.registry.observe("bot_handler_seconds", name, time.perf_counter() - started)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: длительность и ошибки вызовов Bot API.
+    """
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.registry.increment("telegram_api_errors_total", f"{name}:{type(e).__name__}")
+            raise
+        finally:
+            self.registry.observe("telegram_api_seconds", name, time.perf_counter() - started)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """
+    Запускает HTTP-сервер с метриками в формате Prometheus по пути /metrics.
+
+    :param host: Адрес для прослушивания.
+    :param port: Порт.
+    :return: Запущенный AppRunner.
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics server listening on {host}:{port}/metrics")
+    return runner
+
+
+metrics = Metrics()
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+
+from send_scheduler import NOTIFICATION, send_priority
+
+# Ограничение Telegram на длину одного сообщения.
+MESSAGE_LIMIT = 4096
+
+
+class NotificationQueue:
+    """
+    Фоновая очередь исходящих уведомлений.
+
+    Обработчики ставят уведомления в очередь и сразу отвечают
+    пользователю, а фоновая задача собирает их в пачки и отправляет
+    не более workers пачек одновременно. Уведомления в один и тот же
+    чат внутри пачки склеиваются в одно сообщение.
+    Очередь ограничена по размеру; при переполнении новые уведомления
+    отбрасываются с записью в лог.
+    """
+
+    def __init__(self, maxsize=1000, workers=4, batch_size=50, batch_delay=0.2):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.bot = None
+        self._queue = None
+        self._semaphore = None
+        self._tasks = set()
+
+    def start(self, bot: Bot):
+        """
+        Запускает фоновую задачу очереди.
+
+        :param bot: Экземпляр бота Aiogram.
+        """
+        self.bot = bot
+        self._queue = asyncio.Queue(self.maxsize)
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._tasks = {asyncio.create_task(self._collect())}
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def join(self):
+        """
+        Дожидается отправки всех поставленных уведомлений, включая
+        пачки, которые уже забраны из очереди и отправляются.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    def notify(self, chat_id, text: str, fallback=None) -> bool:
+        """
+        Ставит уведомление в очередь.
+
+        :param chat_id: Идентификатор чата получателя.
+        :param text: Текст уведомления.
+        :param fallback: Кортеж (chat_id, text), который отправляется,
+            если доставить уведомление не удалось.
+        :return: True, если уведомление поставлено в очередь.
+        """
+        return self._put((chat_id, text, fallback), chat_id)
+
+    def defer(self, build, description: str = "") -> bool:
+        """
+        Ставит в очередь функцию, которая готовит уведомления уже в фоновой
+        задаче: так обработчик не ждет запросов к базе данных и Bot API,
+        нужных только для текста уведомлений.
+
+        :param build: Функция без аргументов, возвращающая корутину
+            со списком кортежей (chat_id, text, fallback).
+        :param description: Описание для записи в лог.
+        :return: True, если функция поставлена в очередь.
+        """
+        return self._put(build, description)
+
+    def _put(self, item, description) -> bool:
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            logging.warning(f"Notification queue is full, dropping message to {description}")
+            return False
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _collect(self):
+        # Задачи отправки наследуют контекст сборщика, а вместе с ним
+        # и приоритет уведомлений в планировщике отправки.
+        send_priority.set(NOTIFICATION)
+        while True:
+            batch = await self._next_batch()
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch):
+        try:
+            await self._send_batch(batch)
+        except Exception as e:
+            logging.error(f"Failed to send notification batch: {e}")
+        finally:
+            self._semaphore.release()
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _send_batch(self, batch):
+        items = []
+        for item in batch:
+            if not callable(item):
+                items.append(item)
+                continue
+            try:
+                items.extend(await item())
+            except Exception as e:
+                logging.error(f"Failed to prepare notifications: {e}")
+
+        messages = OrderedDict()
+        for chat_id, text, fallback in items:
+            messages.setdefault(str(chat_id), []).append((text, fallback))
+
+        await asyncio.gather(*(self._send_chat(chat_id, items) for chat_id, items in messages.items()))
+
+    async def _send_chat(self, chat_id: str, items):
+        for chunk in _coalesce(items):
+            texts = [text for text, _ in chunk]
+            if await self._send(chat_id, "\n\n".join(texts)):
+                continue
+            for _, fallback in chunk:
+                if fallback is not None:
+                    await self._send(str(fallback[0]), fallback[1])
+
+    async def _send(self, chat_id: str, text: str) -> bool:
+        try:
+            await self.bot.send_message(chat_id, text)
+            return True
+        except Exception as e:
+            logging.error(f"Failed to notify {chat_id}: {e}")
+            return False
+
+    async def drain(self, timeout=30):
+        """
+        Дожидается отправки уже поставленных уведомлений и останавливает очередь.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Dropping {self._queue.qsize()} undelivered notifications on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = set()
+
+
+def _coalesce(items):
+    """
+    Разбивает уведомления одного чата на группы, каждая из которых
+    помещается в одно сообщение.
+    """
+    chunk = []
+    length = 0
+    for text, fallback in items:
+        if chunk and length + len(text) + 2 > MESSAGE_LIMIT:
+            yield chunk
+            chunk = []
+            length = 0
+        chunk.append((text, fallback))
+        length += len(text) + 2
+    if chunk:
+        yield chunk
+
+
+notification_queue = NotificationQueue()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import aiohttp
+
+from fake_telegram import fake_callback_query, fake_message
+
+# Интервал, с которым генератор отправляет накопившиеся обновления.
+TICK = 0.05
+
+
+def read_updates(path: str):
+    """
+    Читает записанные обновления из файла jsonl (одно обновление в строке).
+
+    :param path: Путь к файлу.
+    :return: Генератор словарей в формате Update.
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def synthetic_updates(count: int, users: int, tasks: int, chat_id: int, admin_id: int):
+    """
+    Генерирует поток обновлений, похожий на работу группы: запросы
+    заданий, нажатия кнопок, просмотр статистики и проверку заданий
+    администратором.
+
+    :param count: Количество обновлений.
+    :param users: Количество разных пользователей.
+    :param tasks: Максимальный идентификатор задания.
+    :param chat_id: Идентификатор группы из CHATS бота.
+    :param admin_id: Идентификатор администратора из ADMIN_IDS бота.
+    :return: Генератор словарей в формате Update без update_id.
+    """
+    for _ in range(count):
+        user_id = random.randint(1, users)
+        kind = random.random()
+        if kind < 0.4:
+            yield {"message": fake_message(chat_id, user_id, "/task")}
+        elif kind < 0.65:
+            yield {"callback_query": fake_callback_query(chat_id, user_id, f"accept:{user_id}:{random.randint(1, tasks)}")}
+        elif kind < 0.75:
+            yield {"callback_query": fake_callback_query(chat_id, user_id, f"decline:{user_id}:{random.randint(1, tasks)}")}
+        elif kind < 0.95:
+            yield {"message": fake_message(chat_id, user_id, "/stats")}
+        else:
+            yield {"message": fake_message(chat_id, admin_id, "/accept", reply_to=user_id)}
+
+
+async def replay(updates, rate: float, server: str, webhook: str = None, secret: str = None):
+    """
+    Отправляет обновления с заданной частотой: в очередь getUpdates
+    сервера-заглушки или POST-запросами на webhook бота.
+
+    :param updates: Итератор обновлений.
+    :param rate: Количество обновлений в секунду.
+    :param server: Адрес сервера-заглушки Bot API.
+    :param webhook: Адрес webhook бота; если не задан, обновления отдаются через getUpdates.
+    :param secret: Значение WEBHOOK_SECRET бота.
+    :return: Словарь с результатами.
+    """
+    update_ids = itertools.count(1)
+    latencies = []
+    errors = 0
+    sent = 0
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else None
+
+    async with aiohttp.ClientSession() as session:
+        async def post_webhook(update):
+            nonlocal errors
+            started = time.perf_counter()
+            try:
+                async with session.post(webhook, json=dict(update, update_id=next(update_ids)), headers=headers) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+        pending = set()
+        started = time.perf_counter()
+        exhausted = False
+        while not exhausted:
+            due = int((time.perf_counter() - started) * rate) - sent
+            batch = list(itertools.islice(updates, max(due, 0)))
+            exhausted = due > 0 and len(batch) < due
+            if batch:
+                sent += len(batch)
+                if webhook:
+                    for update in batch:
+                        task = asyncio.create_task(post_webhook(update))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                else:
+                    async with session.post(f"{server}/_push", json=batch) as response:
+                        response.raise_for_status()
+            await asyncio.sleep(TICK)
+        if pending:
+            await asyncio.wait(pending)
+        elapsed = time.perf_counter() - started
+
+        # Ждем, пока бот заберет все обновления из очереди заглушки.
+        stats = None
+        if server:
+            while True:
+                async with session.get(f"{server}/_stats") as response:
+                    stats = await response.json()
+                if webhook or not stats["pending"]:
+                    break
+                await asyncio.sleep(TICK)
+
+    result = {"sent": sent, "seconds": round(elapsed, 3), "rate": round(sent / elapsed, 1) if elapsed else 0.0}
+    if webhook:
+        latencies.sort()
+        result.update(
+            errors=errors,
+            webhook_p50_ms=round(latencies[len(latencies) // 2] * 1000, 3) if latencies else 0.0,
+            webhook_p99_ms=round(latencies[int(len(latencies) * 0.99)] * 1000, 3) if latencies else 0.0,
+        )
+    if stats is not None:
+        result["server"] = stats
+    return result
+
+
+def main():
+    """Подает боту поток обновлений с заданной частотой"""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота: воспроизведение потока обновлений.")
+    parser.add_argument("--server", default="http://127.0.0.1:8081", help="Адрес сервера-заглушки Bot API; пустая строка — не использовать")
+    parser.add_argument("--webhook", help="Адрес webhook бота, например http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", help="Значение WEBHOOK_SECRET бота")
+    parser.add_argument("--input", help="Файл jsonl с записанными обновлениями; по умолчанию обновления генерируются")
+    parser.add_argument("--rate", type=float, default=50, help="Количество обновлений в секунду")
+    parser.add_argument("--count", type=int, default=1000, help="Количество сгенерированных обновлений")
+    parser.add_argument("--users", type=int, default=1000, help="Количество пользователей в сгенерированном потоке")
+    parser.add_argument("--tasks", type=int, default=100, help="Максимальный идентификатор задания")
+    parser.add_argument("--chat", type=int, default=-1001, help="Группа из CHATS бота; запускайте бота с THROTTLING=0, иначе лимиты на чат отбросят большую часть потока")
+    parser.add_argument("--admin", type=int, default=1, help="Администратор из ADMIN_IDS бота")
+    parser.add_argument("--output", help="Файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    if not args.webhook and not args.server:
+        parser.error("укажите --server или --webhook")
+    if args.input:
+        updates = (
+            {key: value for key, value in update.items() if key != "update_id"}
+            for update in read_updates(args.input)
+        )
+    else:
+        updates = synthetic_updates(args.count, args.users, args.tasks, args.chat, args.admin)
+
+    result = asyncio.run(replay(iter(updates), args.rate, args.server.rstrip("/"), args.webhook, args.secret))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,36 @@
-import asyncio
 from aiogram import Bot
 
-from config import CHATS
+from broadcast import Broadcaster
+from config import BROADCAST_INTERVAL, CHATS
+from delayed_jobs import delayed_jobs
 
-async def daily_task(bot: Bot):
+PHOTO_URL = "https://i.imgur.com/qWg3vWs.png"
+CAPTION = "По команде /task можно получить задание. Чтобы задание дублировалось тебе в лс - напиши боту @bastet_task_bot команду /start"
+
+@delayed_jobs.handler("daily_broadcast")
+async def daily_task(bot: Bot, payload: dict):
     """
     Выполняет ежедневную рассылку заданий в указанные чаты.
 
-    Каждые 6 часов отправляет фотографию с заданием и инструкцией
-    в каждый чат из списка CHATS.
+    Отправляет фотографию с заданием и инструкцией во все чаты из
+    списка CHATS одновременно и планирует следующую рассылку через
+    BROADCAST_INTERVAL секунд (по умолчанию 6 часов). Фотография
+    загружается один раз, дальше рассылается ее file_id.
 
     :param bot: Экземпляр бота Aiogram.
+    :param payload: Данные отложенной задачи.
+    """
+    try:
+        await Broadcaster(bot).send_photo(CHATS, PHOTO_URL, CAPTION)
+    finally:
+        await delayed_jobs.schedule("daily_broadcast", BROADCAST_INTERVAL)
+
+async def schedule_daily_task():
+    """
+    Планирует рассылку, если она еще не запланирована.
+
+    Если рассылка была пропущена во время перезапуска, ее задача уже
+    просрочена и будет выполнена сразу после запуска обработчика.
     """
-    while True:
-        for chat_id in CHATS:
-            try:
-                await bot.send_photo(chat_id=str(chat_id), photo="https://i.imgur.com/qWg3vWs.png", caption="По команде /task можно получить задание. Чтобы задание дублировалось тебе в лс - напиши боту @bastet_task_bot команду /start")
-            except Exception as e:
-                print(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
-        await asyncio.sleep(6 * 60 * 60)  # Пауза в 6 часов (6 * 60 * 60 секунд)
+    if not delayed_jobs.pending("daily_broadcast"):
+        await delayed_jobs.schedule("daily_broadcast", 0)
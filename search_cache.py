@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+class SearchCache:
+    """
+    Небольшой LRU-кэш результатов поиска заданий.
+
+    При наборе запроса в inline-режиме Telegram присылает запрос на
+    каждый введенный символ, и при исправлениях одни и те же префиксы
+    повторяются. Кэш сбрасывается при добавлении или удалении заданий,
+    а записи живут не дольше ttl секунд, чтобы изменения из других
+    процессов тоже становились видны.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Возвращает сохраненный результат или None.
+
+        :param key: Ключ запроса.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        """
+        Сохраняет результат, вытесняя самый давно использованный.
+
+        :param key: Ключ запроса.
+        :param result: Результат поиска.
+        """
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Сбрасывает все сохраненные результаты.
+        """
+        self._entries.clear()
+
+
+search_cache = SearchCache()
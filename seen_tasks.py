@@ -0,0 +1,108 @@
+import zlib
+from collections import OrderedDict
+
+import async_database
+from single_flight import user_locks
+from task_index import task_index
+
+# Сколько случайных заданий проверяется, прежде чем перебрать индекс целиком.
+SAMPLE_ATTEMPTS = 32
+
+# Быстрое сжатие: карта сжимается заново при каждой выдаче задания.
+COMPRESSION_LEVEL = 1
+
+
+class SeenTasks:
+    """
+    Выдача заданий без повторов для каждого пользователя.
+
+    Для каждого пользователя хранится битовая карта по идентификаторам
+    заданий: бит task_id установлен, если задание уже выдавалось. Карта
+    хранится сжатой и в базе (user_seen_tasks.seen), и в LRU-кэше
+    размером не больше max_bytes: у пользователя, получившего немного
+    заданий, карта почти из одних нулей и сжимается до десятков байт.
+    Распаковывается она только на время выбора задания.
+
+    Задание выбирается из индекса task_index случайно и отбрасывается,
+    если уже выдавалось, поэтому время выбора не зависит от длины истории.
+    Если за SAMPLE_ATTEMPTS попыток невыданное задание не нашлось,
+    индекс перебирается целиком; когда пользователь получил все задания,
+    его карта очищается и выдача начинается заново. Новые задания
+    получают большие идентификаторы и просто расширяют карту,
+    а удаленные пропадают из индекса и больше не выбираются.
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._blobs = OrderedDict()
+        self._size = 0
+
+    async def _load(self, user_id: int) -> bytes:
+        blob = self._blobs.get(user_id)
+        if blob is not None:
+            self._blobs.move_to_end(user_id)
+            return blob
+        return await async_database.get_seen_tasks(user_id) or b""
+
+    def _store(self, user_id: int, blob: bytes):
+        old = self._blobs.pop(user_id, None)
+        if old is not None:
+            self._size -= len(old)
+        self._blobs[user_id] = blob
+        self._size += len(blob)
+        while self._size > self.max_bytes and len(self._blobs) > 1:
+            _, evicted = self._blobs.popitem(last=False)
+            self._size -= len(evicted)
+
+    @staticmethod
+    def _is_seen(bitmap: bytearray, task_id: int) -> bool:
+        byte = task_id >> 3
+        return byte < len(bitmap) and bool(bitmap[byte] & (1 << (task_id & 7)))
+
+    @staticmethod
+    def _mark(bitmap: bytearray, task_id: int):
+        byte = task_id >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte + 1 - len(bitmap)))
+        bitmap[byte] |= 1 << (task_id & 7)
+
+    def _pick(self, bitmap: bytearray):
+        for _ in range(SAMPLE_ATTEMPTS):
+            task_id = task_index.sample()
+            if task_id is None or not self._is_seen(bitmap, task_id):
+                return task_id
+        for task_id in task_index.scan():
+            if not self._is_seen(bitmap, task_id):
+                return task_id
+        # Все задания уже выдавались — начинаем заново.
+        bitmap.clear()
+        return task_index.sample()
+
+    async def draw(self, user_id: int):
+        """
+        Выбирает задание, которое пользователю еще не выдавалось, и отмечает его.
+
+        :param user_id: Идентификатор пользователя.
+        :return: Кортеж (id, текст задания) или None, если заданий нет.
+        """
+        # Одновременные /task одного пользователя не должны потерять отметку.
+        async with user_locks.lock(user_id):
+            blob = await self._load(user_id)
+            bitmap = bytearray(zlib.decompress(blob)) if blob else bytearray()
+            while True:
+                task_id = self._pick(bitmap)
+                if task_id is None:
+                    return None
+                task_text = await async_database.get_task_by_id(task_id)
+                if task_text is not None:
+                    break
+                # Задание удалено другим процессом.
+                task_index.remove(task_id)
+            self._mark(bitmap, task_id)
+            blob = zlib.compress(bitmap, COMPRESSION_LEVEL)
+            self._store(user_id, blob)
+            await async_database.save_seen_tasks(user_id, blob)
+        return task_id, task_text
+
+
+seen_tasks = SeenTasks()
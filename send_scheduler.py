@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from token_bucket import TokenBucket
+
+# Приоритеты отправки: чем меньше значение, тем раньше запрос получит токен.
+INTERACTIVE = 0
+NOTIFICATION = 1
+BROADCAST = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NOTIFICATION: "notification", BROADCAST: "broadcast"}
+
+# Приоритет задается для текущей задачи asyncio; по умолчанию запросы
+# считаются ответами пользователю.
+send_priority = ContextVar("send_priority", default=INTERACTIVE)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота, 20 сообщений
+# в минуту в группу и около одного сообщения в секунду в личный чат.
+GLOBAL_RATE = 30
+GROUP_RATE = 20 / 60
+GROUP_BURST = 20
+PRIVATE_RATE = 1
+PRIVATE_BURST = 3
+MAX_RETRIES = 3
+# Ведра простаивающих чатов удаляются, когда их становится больше этого числа.
+MAX_CHAT_BUCKETS = 10000
+
+RATE_LIMITED_METHODS = frozenset({
+    "SendMessage",
+    "SendPhoto",
+    "SendDocument",
+    "SendAnimation",
+    "SendVideo",
+    "SendMediaGroup",
+    "CopyMessage",
+    "ForwardMessage",
+    "EditMessageText",
+    "EditMessageCaption",
+    "EditMessageMedia",
+    "EditMessageReplyMarkup",
+})
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих сообщений для сессии бота.
+
+    Все отправки и редактирования сообщений проходят через общее ведро
+    токенов бота и ведро конкретного чата. Ожидающие запросы выдаются
+    в порядке приоритета (ответы пользователям раньше уведомлений и
+    рассылок), а TelegramRetryAfter обрабатывается прозрачно: чат
+    ставится на паузу и запрос повторяется.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE):
+        self.global_rate = global_rate
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.processes = 1
+        self._chat_buckets = {}
+        self._waiters = []
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._pump_task = None
+        self.retries = 0
+
+    def set_process_count(self, processes: int):
+        """
+        Делит лимиты Telegram поровну между процессами бота.
+
+        Делятся и общий лимит, и лимиты отдельных чатов: обновления
+        распределяются по процессам по пользователю, поэтому ответы
+        в одну группу отправляют все процессы.
+
+        :param processes: Количество процессов, отправляющих сообщения.
+        """
+        self.processes = processes
+        rate = self.global_rate / processes
+        self.global_bucket = TokenBucket(rate, rate)
+        self._chat_buckets = {}
+
+    def depth(self):
+        """
+        Возвращает количество запросов, ожидающих отправки.
+
+        :return: Словарь {имя приоритета: количество ожидающих запросов}.
+        """
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return depth
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._evict_idle()
+            if isinstance(chat_id, int) and chat_id > 0:
+                rate, burst = PRIVATE_RATE, PRIVATE_BURST
+            else:
+                rate, burst = GROUP_RATE, GROUP_BURST
+            bucket = TokenBucket(rate / self.processes, max(1, burst // self.processes))
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _evict_idle(self):
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.delay(bucket.capacity) == 0]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    async def _acquire(self, chat_id, priority):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), chat_id, future))
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+        else:
+            self._wakeup.set()
+        await future
+
+    def _grant(self):
+        """
+        Выдает токен первому по приоритету запросу, чат которого не
+        исчерпал лимит.
+
+        :return: Время ожидания до следующей попытки или 0, если токен выдан.
+        """
+        skipped = []
+        wait = math.inf
+        granted = False
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            _, _, chat_id, future = entry
+            if future.done():
+                continue
+            bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+            if bucket is None or bucket.try_acquire():
+                self.global_bucket.try_acquire()
+                future.set_result(None)
+                granted = True
+                break
+            wait = min(wait, bucket.delay())
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+        return 0 if granted else wait
+
+    async def _pump(self):
+        while self._waiters:
+            delay = self.global_bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            wait = self._grant()
+            if wait == 0:
+                continue
+            if not self._waiters:
+                break
+            # Все ожидающие чаты исчерпали лимит: ждем пополнения ведра
+            # или нового запроса.
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __call__(self, make_request, bot, method):
+        if type(method).__name__ not in RATE_LIMITED_METHODS:
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        attempts = 0
+        while True:
+            attempts += 1
+            await self._acquire(chat_id, send_priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempts > MAX_RETRIES:
+                    raise
+                self.retries += 1
+                logging.warning(f"Flood control for chat {chat_id}, retrying {type(method).__name__} in {e.retry_after}s")
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(e.retry_after)
+                else:
+                    self.global_bucket.pause(e.retry_after)
+
+
+send_scheduler = SendScheduler()
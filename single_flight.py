@@ -0,0 +1,88 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в одно выполнение.
+
+    Пока функция выполняется, повторные вызовы с тем же ключом ждут ее
+    результат. Результат еще ttl секунд отдается сразу, поэтому двойное
+    нажатие кнопки после завершения обработки тоже не выполняет ее снова.
+    """
+
+    def __init__(self, ttl: float = 5.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._calls = {}
+        self._results = OrderedDict()
+
+    async def do(self, key, func):
+        """
+        Выполняет func() один раз для всех одновременных вызовов с ключом key.
+
+        :param key: Ключ вызова.
+        :param func: Функция без аргументов, возвращающая корутину.
+        :return: Кортеж (результат, True для повторного вызова).
+        """
+        cached = self._results.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                return result, True
+            del self._results[key]
+
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Ошибку получат только ожидающие повторные вызовы.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self._remember(key, result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+    def _remember(self, key, result):
+        self._results[key] = (time.monotonic() + self.ttl, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+
+class StripedLocks:
+    """
+    Фиксированный набор блокировок, между которыми распределяются ключи.
+
+    Изменения данных одного пользователя выполняются последовательно,
+    а память не растет с количеством пользователей; разные пользователи
+    изредка делят одну блокировку.
+    """
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def lock(self, key) -> asyncio.Lock:
+        """
+        Возвращает блокировку для ключа.
+
+        :param key: Ключ, например идентификатор пользователя.
+        """
+        return self._locks[hash(key) % len(self._locks)]
+
+
+callback_flights = SingleFlight()
+user_locks = StripedLocks()
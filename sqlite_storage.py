@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import async_database
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state=None, data=None, updated_at=0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в SQLite с LRU-кэшем в памяти.
+
+    Часто используемые ключи держатся в ограниченном кэше, изменения
+    накапливаются и записываются в таблицу fsm_storage пачкой раз в
+    flush_interval секунд. Состояния, которые не менялись дольше ttl
+    секунд, считаются пустыми и периодически удаляются из базы.
+    """
+
+    def __init__(
+        self,
+        key_builder: Optional[KeyBuilder] = None,
+        maxsize=10000,
+        ttl=24 * 60 * 60,
+        flush_interval=1.0,
+        purge_interval=60 * 60,
+    ):
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._flush_task = None
+        self._purged_at = time.time()
+
+    def _expired(self, record: _Record) -> bool:
+        return record.updated_at + self.ttl < time.time()
+
+    def _remember(self, key: str, record: _Record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    async def _get(self, key: str) -> _Record:
+        record = self._cache.get(key)
+        if record is None:
+            record = self._dirty.get(key)
+        if record is None:
+            row = await async_database.get_fsm_record(key)
+            # Пока шло чтение, запись могла появиться в кэше.
+            record = self._cache.get(key)
+            if record is None:
+                record = _Record(row[0], json.loads(row[1]), row[2]) if row else _Record()
+        if self._expired(record):
+            record = _Record()
+        self._remember(key, record)
+        return record
+
+    def _touch(self, key: str, record: _Record):
+        record.updated_at = time.time()
+        self._dirty[key] = record
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """
+        Записывает накопленные изменения в базу данных.
+        """
+        self._flush_task = None
+        dirty, self._dirty = self._dirty, {}
+        upserts = []
+        deletes = []
+        for key, record in dirty.items():
+            if record.state is None and not record.data:
+                deletes.append(key)
+            else:
+                upserts.append((key, record.state, json.dumps(record.data), record.updated_at))
+        purge_before = None
+        if time.time() - self._purged_at >= self.purge_interval:
+            self._purged_at = time.time()
+            purge_before = self._purged_at - self.ttl
+        if not upserts and not deletes and purge_before is None:
+            return
+        try:
+            await async_database.save_fsm_records(upserts, deletes, purge_before)
+        except Exception as e:
+            logging.error(f"Failed to save {len(dirty)} FSM records: {e}")
+            # Возвращаем изменения, которые не были перезаписаны за время записи.
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self.key_builder.build(key)
+        record = await self._get(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get(self.key_builder.build(key))
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key = self.key_builder.build(key)
+        record = await self._get(key)
+        record.data = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get(self.key_builder.build(key))
+        return record.data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import logging
+import time
+
+import async_database
+from config import TASK_DEADLINE, TASK_REMINDER
+from notifications import notification_queue
+
+REMIND = "remind"
+EXPIRE = "expire"
+
+# Сроки, которые другие процессы могли записать позже уже прочитанных.
+POLL_OVERLAP = 5
+
+
+class TaskDeadlines:
+    """
+    Сроки выполнения выданных заданий.
+
+    Ближайшие напоминания и сроки лежат в куче, и единственный фоновый
+    обработчик спит ровно до следующего из них, а затем обрабатывает
+    все наступившие события пачкой: одним запросом снимает просроченные
+    задания и одним запросом проверяет задания перед напоминанием.
+    Уведомления уходят через ограниченную очередь notification_queue.
+
+    Выполненные и отклоненные задания из кучи не удаляются: перед
+    обработкой событие сверяется с базой данных. После перезапуска куча
+    строится заново по индексу user_tasks.deadline.
+    """
+
+    def __init__(self, deadline=TASK_DEADLINE, reminder=TASK_REMINDER, batch_size=100):
+        self.deadline = deadline
+        self.reminder = reminder
+        self.batch_size = batch_size
+        self.poll_interval = None
+        self._heap = []
+        self._tracked = {}
+        self._polled_until = None
+        self._wakeup = None
+        self._task = None
+
+    async def assign(self, user_id: int, task_id: int, chat_id: int = None) -> bool:
+        """
+        Выдает задание пользователю со сроком выполнения.
+
+        :param user_id: Идентификатор пользователя.
+        :param task_id: Идентификатор задания.
+        :param chat_id: Идентификатор чата, в котором принято задание.
+        :return: True, если задание выдано; False, если у пользователя уже есть активное задание.
+        """
+        deadline = time.time() + self.deadline
+        if not await async_database.add_task_to_user(user_id, task_id, deadline, chat_id):
+            return False
+        if self._task is not None:
+            self._track(deadline, user_id, task_id)
+        return True
+
+    def _track(self, deadline, user_id, task_id):
+        if self._tracked.get(user_id) == deadline:
+            return
+        self._tracked[user_id] = deadline
+        heapq.heappush(self._heap, (deadline, EXPIRE, user_id, task_id, deadline))
+        remind_at = deadline - self.reminder
+        if self.reminder and remind_at > time.time():
+            heapq.heappush(self._heap, (remind_at, REMIND, user_id, task_id, deadline))
+        if self._wakeup is not None and self._heap[0][2] == user_id:
+            self._wakeup.set()
+
+    async def load(self):
+        """
+        Строит кучу по срокам активных заданий из базы данных.
+        """
+        self._heap = []
+        self._tracked = {}
+        rows = await async_database.get_task_deadlines()
+        for deadline, user_id, task_id in rows:
+            self._track(deadline, user_id, task_id)
+        self._polled_until = rows[-1][0] if rows else time.time()
+
+    async def _poll(self):
+        rows = await async_database.get_task_deadlines(self._polled_until - POLL_OVERLAP)
+        for deadline, user_id, task_id in rows:
+            self._track(deadline, user_id, task_id)
+        if rows:
+            self._polled_until = max(self._polled_until, rows[-1][0])
+
+    def start(self, poll_interval=None):
+        """
+        Запускает фоновый обработчик сроков.
+
+        Если задания выдают другие процессы, задайте poll_interval: раз
+        в столько секунд обработчик будет забирать из базы новые сроки.
+
+        :param poll_interval: Интервал опроса базы в секундах или None.
+        """
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновый обработчик.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self.poll_interval is not None:
+                try:
+                    await self._poll()
+                except Exception as e:
+                    logging.error(f"Failed to poll task deadlines: {e}")
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if self.poll_interval is not None and (delay is None or delay > self.poll_interval):
+                delay = self.poll_interval
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            reminders = []
+            expired = []
+            while self._heap and self._heap[0][0] <= now and len(reminders) + len(expired) < self.batch_size:
+                _, kind, user_id, task_id, deadline = heapq.heappop(self._heap)
+                if kind == REMIND:
+                    reminders.append((user_id, task_id, deadline))
+                else:
+                    expired.append((user_id, task_id))
+                    if self._tracked.get(user_id) == deadline:
+                        del self._tracked[user_id]
+            try:
+                await self._expire(expired, now)
+                await self._remind(reminders)
+            except Exception as e:
+                logging.error(f"Failed to process {len(expired) + len(reminders)} task deadlines: {e}")
+
+    async def _expire(self, tasks, now):
+        if not tasks:
+            return
+        expired = await async_database.expire_user_tasks(tasks, now)
+        for user_id, _ in expired:
+            notification_queue.notify(
+                user_id,
+                "Время на выполнение задания истекло, задание снято. Новое задание можно получить командой /task.",
+            )
+        if expired:
+            logging.info(f"Expired {len(expired)} tasks")
+
+    async def _remind(self, reminders):
+        if not reminders:
+            return
+        active = await async_database.get_user_tasks([user_id for user_id, _, _ in reminders])
+        for user_id, task_id, deadline in reminders:
+            if active.get(user_id) != (task_id, deadline):
+                continue
+            hours = max(1, round((deadline - time.time()) / 3600))
+            notification_queue.notify(user_id, f"Напоминание: на выполнение задания осталось около {hours} ч.")
+
+
+task_deadlines = TaskDeadlines()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import io
+import json
+import os
+
+from database import create_connection, create_tables, import_tasks
+
+FORMATS = ("txt", "csv", "jsonl")
+TEXT_FIELDS = ("task_text", "text", "task")
+
+
+class TaskImportError(Exception):
+    """
+    Импорт прерван ошибкой в файле. Порции, вставленные до ошибки,
+    уже зафиксированы; added — количество добавленных в них заданий.
+    """
+
+    def __init__(self, added: int, error: Exception):
+        super().__init__(f"import stopped after {added} tasks: {error}")
+        self.added = added
+        self.error = error
+
+
+def detect_format(filename: str) -> str:
+    """
+    Определяет формат файла с заданиями по расширению.
+
+    :param filename: Имя файла.
+    :return: Один из форматов "txt", "csv" или "jsonl".
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return "txt"
+
+
+def _text_from_record(record):
+    if isinstance(record, str):
+        return record
+    if isinstance(record, dict):
+        for field in TEXT_FIELDS:
+            if isinstance(record.get(field), str):
+                return record[field]
+    return None
+
+
+def iter_tasks(stream, fmt: str):
+    """
+    Построчно читает тексты заданий из текстового потока.
+
+    txt — одно задание в строке; csv — колонка task_text/text/task или
+    первая колонка; jsonl — строка JSON или объект с полем task_text/text/task.
+    Пустые строки пропускаются.
+
+    :param stream: Текстовый поток.
+    :param fmt: Формат файла.
+    :return: Итератор текстов заданий.
+    """
+    if fmt == "csv":
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        column = next((header.index(field) for field in TEXT_FIELDS if field in header), None)
+        if column is None:
+            # Заголовка нет: первая строка — тоже задание.
+            column = 0
+            if header and header[0].strip():
+                yield header[0].strip()
+        for row in reader:
+            if len(row) > column and row[column].strip():
+                yield row[column].strip()
+    elif fmt == "jsonl":
+        for line in stream:
+            if not line.strip():
+                continue
+            task_text = _text_from_record(json.loads(line))
+            if task_text and task_text.strip():
+                yield task_text.strip()
+    else:
+        for line in stream:
+            if line.strip():
+                yield line.strip()
+
+
+def import_stream(conn, binary_stream, filename: str, fmt: str = None, chunk_size: int = 1000):
+    """
+    Импортирует задания из двоичного потока файла.
+
+    :param conn: Объект соединения с базой данных.
+    :param binary_stream: Двоичный поток с содержимым файла в UTF-8.
+    :param filename: Имя файла для определения формата.
+    :param fmt: Формат файла; если не задан, определяется по расширению.
+    :param chunk_size: Количество заданий в одной транзакции.
+    :return: Кортеж (список идентификаторов добавленных заданий,
+        количество пропущенных дубликатов).
+    """
+    stream = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    return import_tasks(conn, iter_tasks(stream, fmt or detect_format(filename)), chunk_size)
+
+
+def main():
+    """Импортирует задания из файла в базу данных"""
+    parser = argparse.ArgumentParser(description="Массовый импорт заданий в базу данных.")
+    parser.add_argument("path", help="Файл с заданиями (txt, csv или jsonl)")
+    parser.add_argument("--format", choices=FORMATS, help="Формат файла; по умолчанию определяется по расширению")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Количество заданий в одной транзакции")
+    args = parser.parse_args()
+
+    conn = create_connection()
+    try:
+        create_tables(conn)
+        with open(args.path, "rb") as file:
+            task_ids, skipped = import_stream(conn, file, args.path, args.format, args.chunk_size)
+        print(f"Добавлено заданий: {len(task_ids)}, пропущено дубликатов: {skipped}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
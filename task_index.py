@@ -0,0 +1,87 @@
+import random
+from array import array
+
+
+class TaskIndex:
+    """
+    Индекс идентификаторов активных заданий в памяти.
+
+    Идентификаторы лежат в компактном массиве, поэтому случайное задание
+    выбирается за O(1) без сортировки таблицы tasks. Удаление выполняется
+    перестановкой с последним элементом массива.
+
+    synced_id — наибольший идентификатор, прочитанный из базы при загрузке
+    или синхронизации. Локальные add() его не двигают: другой процесс мог
+    зафиксировать задание с меньшим идентификатором.
+    """
+
+    def __init__(self):
+        self._ids = array("q")
+        self._positions = {}
+        self.synced_id = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, task_id):
+        return task_id in self._positions
+
+    def load(self, task_ids):
+        """
+        Заполняет индекс заново.
+
+        :param task_ids: Итерируемый набор идентификаторов заданий.
+        """
+        self._ids = array("q", task_ids)
+        self._positions = {task_id: position for position, task_id in enumerate(self._ids)}
+        self.synced_id = max(self._ids, default=0)
+
+    def add(self, task_id: int):
+        """
+        Добавляет задание в индекс.
+
+        :param task_id: Идентификатор задания.
+        """
+        if task_id in self._positions:
+            return
+        self._positions[task_id] = len(self._ids)
+        self._ids.append(task_id)
+
+    def remove(self, task_id: int):
+        """
+        Удаляет задание из индекса, если оно там есть.
+
+        :param task_id: Идентификатор задания.
+        """
+        position = self._positions.pop(task_id, None)
+        if position is None:
+            return
+        last_id = self._ids.pop()
+        if last_id != task_id:
+            self._ids[position] = last_id
+            self._positions[last_id] = position
+
+    def sample(self):
+        """
+        Возвращает случайный идентификатор задания.
+
+        :return: Идентификатор задания или None, если заданий нет.
+        """
+        if not self._ids:
+            return None
+        return self._ids[random.randrange(len(self._ids))]
+
+    def scan(self):
+        """
+        Перебирает все идентификаторы, начиная со случайной позиции.
+
+        :return: Генератор идентификаторов заданий.
+        """
+        if not self._ids:
+            return
+        start = random.randrange(len(self._ids))
+        for position in range(start - len(self._ids), start):
+            yield self._ids[position]
+
+
+task_index = TaskIndex()
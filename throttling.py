@@ -0,0 +1,148 @@
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import ADMIN_IDS
+from metrics import metrics
+from token_bucket import TokenBucket
+
+
+class Limit(NamedTuple):
+    """
+    Ограничения команды: (скорость в секунду, всплеск) для одного
+    пользователя и для одного чата; None — без ограничения.
+    """
+
+    user: Optional[Tuple[float, float]]
+    chat: Optional[Tuple[float, float]]
+
+
+# Нажатия кнопок ограничиваются под именем "callback".
+LIMITS = {
+    "start": Limit(user=(1 / 10, 2), chat=(1, 5)),
+    "task": Limit(user=(1 / 5, 2), chat=(2, 10)),
+    "stats": Limit(user=(1 / 10, 2), chat=(1 / 2, 3)),
+    "callback": Limit(user=(1, 3), chat=None),
+}
+
+MAX_BUCKETS = 100000
+
+WARNING = "Слишком много запросов, попробуйте чуть позже."
+
+
+def command_name(message: Message) -> Optional[str]:
+    """
+    Возвращает имя команды из текста сообщения без "/" и @имени бота.
+
+    :param message: Сообщение.
+    :return: Имя команды или None, если сообщение не команда.
+    """
+    text = message.text or message.caption
+    if not text or not text.startswith("/"):
+        return None
+    return text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware, который отбрасывает слишком частые команды
+    до фильтров и обработчиков, не обращаясь к базе данных.
+
+    Для каждой команды из LIMITS ведутся ведра токенов на пользователя
+    и на чат. Когда ведро пустеет, пользователь один раз получает
+    предупреждение, а следующие команды молча отбрасываются, пока ведро
+    не пополнится. Полные ведра давно не писавших пользователей удаляются,
+    когда их становится больше MAX_BUCKETS. Администраторы не ограничиваются.
+    """
+
+    def __init__(self, limits=LIMITS, max_buckets=MAX_BUCKETS):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._warned = set()
+
+    def set_process_count(self, processes: int):
+        """
+        Делит лимиты чатов между процессами-обработчиками.
+
+        Обновления распределяются по процессам по пользователю, поэтому
+        команды одного чата проверяет каждый процесс своими ведрами.
+        Лимиты пользователей не меняются: все его обновления попадают
+        в один процесс.
+
+        :param processes: Количество процессов-обработчиков.
+        """
+        self.limits = {
+            name: limit._replace(
+                chat=(limit.chat[0] / processes, max(1, limit.chat[1] // processes)) if limit.chat else None
+            )
+            for name, limit in self.limits.items()
+        }
+        self._buckets = {}
+        self._warned = set()
+
+    def _bucket(self, key, rate, capacity) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._evict_idle()
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    def _evict_idle(self):
+        idle = [key for key, bucket in self._buckets.items() if bucket.delay(bucket.capacity) == 0]
+        for key in idle:
+            del self._buckets[key]
+            self._warned.discard(key)
+
+    def allow(self, name: str, user_id: int, chat_id: int) -> Tuple[bool, bool]:
+        """
+        Проверяет лимиты команды.
+
+        :param name: Имя команды.
+        :param user_id: Идентификатор пользователя.
+        :param chat_id: Идентификатор чата.
+        :return: Кортеж (разрешено, нужно ли предупредить пользователя).
+        """
+        limit = self.limits[name]
+        user_key = (name, "user", user_id)
+        checks = []
+        if limit.user is not None:
+            checks.append((user_key, limit.user))
+        if limit.chat is not None:
+            checks.append(((name, "chat", chat_id), limit.chat))
+        for key, (rate, capacity) in checks:
+            if not self._bucket(key, rate, capacity).try_acquire():
+                warn = user_key not in self._warned
+                self._warned.add(user_key)
+                return False, warn
+        self._warned.discard(user_key)
+        return True, False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        if user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        name = "callback" if isinstance(event, CallbackQuery) else command_name(event)
+        if name not in self.limits:
+            return await handler(event, data)
+
+        allowed, warn = self.allow(name, user.id, chat.id if chat is not None else user.id)
+        if allowed:
+            return await handler(event, data)
+
+        metrics.increment("bot_throttled_total", name)
+        if isinstance(event, CallbackQuery):
+            # На нажатие кнопки нужно ответить, иначе у пользователя будет висеть загрузка.
+            return event.answer(WARNING if warn else None)
+        if warn:
+            return event.reply(WARNING)
+        return None
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Ведро токенов для ограничения частоты операций.
+
+    Ведро пополняется со скоростью rate токенов в секунду и вмещает
+    не больше capacity токенов, что допускает короткие всплески.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Забирает токены, если они есть.
+
+        :param tokens: Количество токенов.
+        :return: True, если токены получены.
+        """
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """
+        Возвращает время ожидания до появления нужного количества токенов.
+
+        :param tokens: Количество токенов.
+        :return: Задержка в секундах, 0 если токены уже есть.
+        """
+        self._refill(time.monotonic())
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Запрещает выдачу токенов на указанное время; сразу после паузы
+        доступен один токен.
+
+        :param seconds: Длительность паузы в секундах.
+        """
+        self.tokens = min(1, self.capacity)
+        self.updated_at = max(self.updated_at, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: float = 1):
+        """
+        Ждет, пока в ведре появятся токены, и забирает их.
+
+        :param tokens: Количество токенов.
+        """
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, User
+
+import async_database
+
+# Сохранение профилей в базу откладывается, чтобы записать их одной пачкой.
+FLUSH_DELAY = 1.0
+
+
+def display_name(username, first_name):
+    """
+    Возвращает имя пользователя для отображения.
+
+    :param username: Имя пользователя в Telegram или None.
+    :param first_name: Имя пользователя.
+    :return: username, если он задан, иначе first_name.
+    """
+    return username if username else first_name
+
+
+class UserCache:
+    """
+    LRU-кэш профилей пользователей с ограниченным временем жизни записей.
+
+    Профили попадают в кэш из каждого входящего обновления и сохраняются
+    в таблицу users, поэтому имена для /stats и уведомлений обычно
+    известны без запросов к Telegram.
+    """
+
+    def __init__(self, maxsize=10000, ttl=24 * 60 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._flush_task = None
+
+    def get(self, user_id: int):
+        """
+        Возвращает имя пользователя из кэша.
+
+        :param user_id: Идентификатор пользователя.
+        :return: Имя для отображения или None, если записи нет или она устарела.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return name
+
+    def put(self, user_id: int, username, first_name) -> bool:
+        """
+        Помещает профиль в кэш.
+
+        :param user_id: Идентификатор пользователя.
+        :param username: Имя пользователя в Telegram или None.
+        :param first_name: Имя пользователя.
+        :return: True, если имени не было в кэше или оно изменилось.
+        """
+        name = display_name(username, first_name)
+        changed = self.get(user_id) != name
+        self._entries[user_id] = (name, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return changed
+
+    def remember(self, user: User):
+        """
+        Запоминает профиль пользователя из обновления и, если он изменился,
+        ставит его в очередь на сохранение в базу.
+
+        :param user: Пользователь Telegram.
+        """
+        self._store(user.id, user.username, user.first_name)
+
+    def _store(self, user_id: int, username, first_name):
+        if self.put(user_id, username, first_name):
+            self._pending[user_id] = (user_id, username, first_name, int(time.time()))
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        """
+        Сохраняет накопленные профили в базу данных.
+        """
+        self._flush_task = None
+        if not self._pending:
+            return
+        users, self._pending = list(self._pending.values()), {}
+        try:
+            await async_database.upsert_users(users)
+        except Exception as e:
+            logging.error(f"Failed to save {len(users)} user profiles: {e}")
+
+    async def resolve(self, bot: Bot, user_ids):
+        """
+        Возвращает имена пользователей, обращаясь к сети только при промахе.
+
+        Сначала используется кэш, затем таблица users, и только оставшиеся
+        пользователи запрашиваются через get_chat одновременно.
+
+        :param bot: Экземпляр бота Aiogram.
+        :param user_ids: Список идентификаторов пользователей.
+        :return: Словарь {user_id: имя}; пользователи, которых не удалось
+            найти, в словарь не попадают.
+        """
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+
+        if missing:
+            for user_id, username, first_name in await async_database.get_users(missing):
+                self.put(user_id, username, first_name)
+                names[user_id] = display_name(username, first_name)
+            missing = [user_id for user_id in missing if user_id not in names]
+
+        if missing:
+            chats = await asyncio.gather(*(bot.get_chat(user_id) for user_id in missing), return_exceptions=True)
+            for user_id, chat in zip(missing, chats):
+                if isinstance(chat, Exception):
+                    logging.error(f"Ошибка при получении информации о пользователе {user_id}: {chat}")
+                    continue
+                self._store(user_id, chat.username, chat.first_name)
+                names[user_id] = display_name(chat.username, chat.first_name)
+
+        return names
+
+
+class UserCacheMiddleware(BaseMiddleware):
+    """
+    Внешний middleware, который запоминает автора каждого обновления.
+    """
+
+    def __init__(self, cache: UserCache):
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.cache.remember(user)
+        return await handler(event, data)
+
+
+user_cache = UserCache()
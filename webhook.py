@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import warnings
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from config import (
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_CONCURRENCY,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_RESPONSE_TIMEOUT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from metrics import handle_metrics
+
+# Telegram открывает к webhook не больше 100 соединений одновременно.
+MAX_CONNECTIONS = 100
+
+# Перевод медленного обработчика в фон здесь ожидаем (см. LimitedRequestHandler).
+warnings.filterwarnings("ignore", message="Detected slow response into webhook", category=RuntimeWarning)
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик webhook, который ограничивает число одновременно
+    обрабатываемых обновлений.
+
+    Ответ на запрос ждет обработчик не дольше response_timeout секунд.
+    Если обработчик успел, возвращенный им метод (например, ответ на
+    callback query) отправляется Telegram прямо в ответе webhook без
+    отдельного запроса. Иначе Telegram сразу получает пустой ответ,
+    а обработчик продолжает работу в фоне: ответы и правки сообщений
+    в группах могут ждать лимита отправки десятки секунд, и удерживать
+    на это время соединения Telegram нельзя — он исчерпает их
+    и начнет повторно доставлять те же обновления.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token=None,
+        max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+        response_timeout=WEBHOOK_RESPONSE_TIMEOUT,
+        **data,
+    ):
+        super().__init__(dispatcher, bot, handle_in_background=False, secret_token=secret_token, **data)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.response_timeout = response_timeout
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        async with self.semaphore:
+            result = await self.dispatcher.feed_webhook_update(
+                bot,
+                await request.json(loads=bot.session.json_loads),
+                _timeout=self.response_timeout,
+                **self.data,
+            )
+        return web.Response(body=self._build_response_writer(bot=bot, result=result))
+
+    async def close(self) -> None:
+        # Сессию бота закрывает основной код после отправки оставшихся уведомлений.
+        pass
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """
+    Создает aiohttp-приложение, принимающее обновления по WEBHOOK_PATH
+    и отдающее метрики по /metrics.
+
+    :param dp: Диспетчер Aiogram.
+    :param bot: Экземпляр бота Aiogram.
+    :return: aiohttp-приложение.
+    """
+    app = web.Application()
+    handler = LimitedRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET or None)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def start_webhook(dp: Dispatcher, bot: Bot, allowed_updates=None) -> web.AppRunner:
+    """
+    Запускает HTTP-сервер webhook и, если задан WEBHOOK_URL,
+    регистрирует webhook в Telegram.
+
+    Без WEBHOOK_URL сервер можно проверить локально, отправляя
+    сохраненные обновления POST-запросом на WEBHOOK_PATH.
+
+    :param dp: Диспетчер Aiogram.
+    :param bot: Экземпляр бота Aiogram.
+    :param allowed_updates: Типы обновлений; по умолчанию те, что обрабатывает dp.
+    :return: Запущенный AppRunner; для остановки вызовите runner.cleanup().
+    """
+    runner = web.AppRunner(create_app(dp, bot))
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logging.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            max_connections=min(MAX_CONNECTIONS, WEBHOOK_MAX_CONCURRENCY),
+            allowed_updates=allowed_updates if allowed_updates is not None else dp.resolve_used_update_types(),
+        )
+    return runner
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates=None):
+    """
+    Обрабатывает обновления через webhook до отмены задачи.
+
+    :param dp: Диспетчер Aiogram.
+    :param bot: Экземпляр бота Aiogram.
+    :param allowed_updates: Типы обновлений; по умолчанию те, что обрабатывает dp.
+    """
+    await dp.emit_startup(bot=bot)
+    runner = await start_webhook(dp, bot, allowed_updates)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
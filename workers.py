@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+import async_database
+from config import BOT_MODE, METRICS_PORT
+from send_scheduler import send_scheduler
+from webhook import run_webhook
+
+# Размер очереди обновлений каждого процесса-обработчика.
+QUEUE_SIZE = 1000
+# Сколько обновлений один обработчик выполняет одновременно.
+WORKER_CONCURRENCY = 100
+# Как часто обработчики подтягивают изменения, сделанные другими процессами.
+SYNC_INTERVAL = 2.0
+# Запас по времени при синхронизации статистики: запись могла быть
+# зафиксирована чуть позже, чем получила свою метку времени.
+SYNC_OVERLAP = 5.0
+# Как часто процесс приема забирает отложенные задачи, созданные обработчиками.
+JOBS_POLL_INTERVAL = 1.0
+
+
+def shard_key(data: Dict[str, Any]) -> int:
+    """
+    Возвращает ключ шардирования обновления: идентификатор пользователя,
+    а если его нет — идентификатор чата.
+
+    :param data: Данные обработки обновления из middleware.
+    :return: Ключ шардирования.
+    """
+    user = data.get("event_from_user")
+    if user is not None:
+        return user.id
+    chat = data.get("event_chat")
+    return chat.id if chat is not None else 0
+
+
+class ShardingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware процесса приема: вместо обработки отправляет
+    обновление в очередь процесса-обработчика, выбранного по пользователю.
+
+    Все обновления одного пользователя попадают в один процесс и в одну
+    очередь, поэтому их порядок и состояние FSM сохраняются.
+    """
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        key = shard_key(data)
+        item = (key, event.model_dump(mode="json", exclude_unset=True))
+        shard = self.queues[key % len(self.queues)]
+        try:
+            shard.put_nowait(item)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, shard.put, item)
+
+
+class KeyedProcessor:
+    """
+    Выполняет обновления конкурентно, сохраняя порядок внутри одного ключа.
+
+    Обновление ждет завершения предыдущего обновления с тем же ключом;
+    общее число обновлений в работе ограничено семафором.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, concurrency=WORKER_CONCURRENCY):
+        self.dp = dp
+        self.bot = bot
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tails = {}
+
+    async def submit(self, key: int, update: Dict[str, Any]):
+        """
+        Ставит обновление в работу; ждет, если достигнут лимит конкурентности.
+
+        :param key: Ключ шардирования.
+        :param update: Обновление в виде словаря.
+        """
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(self._tails.get(key), update))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._release(key, done))
+
+    def _release(self, key: int, task: asyncio.Task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _process(self, previous, update: Dict[str, Any]):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            result = await self.dp.feed_raw_update(self.bot, update)
+            if isinstance(result, TelegramMethod):
+                await self.dp.silent_call_request(self.bot, result)
+        except Exception as e:
+            logging.exception(f"Failed to process update {update.get('update_id')}: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def join(self):
+        """
+        Дожидается завершения всех обновлений в работе.
+        """
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+async def _sync_loop():
+    since = time.time()
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL)
+        now = time.time()
+        try:
+            await async_database.sync_task_index()
+            await async_database.sync_leaderboard(since - SYNC_OVERLAP)
+            since = now
+        except Exception as e:
+            logging.error(f"Failed to sync worker state: {e}")
+
+
+def _get(updates):
+    try:
+        return updates.get(timeout=1)
+    except queue.Empty:
+        return queue.Empty
+
+
+async def _run_worker(index: int, updates, workers: int):
+    import bot as app
+    from loader import bot
+
+    # Лимиты Telegram общие для всех процессов бота, а команды одного
+    # чата проверяют все обработчики.
+    send_scheduler.set_process_count(workers + 1)
+    app.throttling.set_process_count(workers)
+    await app.on_startup(app.dp, run_jobs=False, metrics_port=METRICS_PORT and METRICS_PORT + index + 1)
+    await app.dp.emit_startup(bot=bot)
+    sync_task = asyncio.create_task(_sync_loop())
+    processor = KeyedProcessor(app.dp, bot)
+    loop = asyncio.get_running_loop()
+    logging.info(f"Worker {index} started")
+    try:
+        while True:
+            item = await loop.run_in_executor(None, _get, updates)
+            if item is queue.Empty:
+                continue
+            if item is None:
+                break
+            await processor.submit(*item)
+        await processor.join()
+    finally:
+        sync_task.cancel()
+        await app.dp.emit_shutdown(bot=bot)
+        await app.on_shutdown()
+        logging.info(f"Worker {index} stopped")
+
+
+def worker_main(index: int, updates, workers: int):
+    """
+    Точка входа процесса-обработчика.
+
+    Процесс игнорирует SIGINT и завершается, получив None из очереди,
+    чтобы успеть обработать уже принятые обновления.
+
+    :param index: Номер процесса.
+    :param updates: Очередь обновлений процесса.
+    :param workers: Общее количество процессов-обработчиков.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_worker(index, updates, workers))
+
+
+async def run_intake(dp: Dispatcher, bot: Bot, workers: int):
+    """
+    Принимает обновления (опросом или через webhook) и распределяет их
+    по процессам-обработчикам, каждый из которых выполняет router из handlers.
+
+    Обработчики пишут в ту же базу SQLite через собственные WAL-соединения,
+    а изменения заданий и рейтинга, сделанные другими процессами,
+    подтягивают каждые SYNC_INTERVAL секунд. Лимиты отправки Telegram,
+    общий и на чат, делятся между всеми процессами поровну.
+
+    :param dp: Основной диспетчер; используется для определения типов обновлений.
+    :param bot: Экземпляр бота Aiogram.
+    :param workers: Количество процессов-обработчиков.
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(index, queues[index], workers), name=f"worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    send_scheduler.set_process_count(workers + 1)
+    intake = Dispatcher()
+    intake.update.outer_middleware(ShardingMiddleware(queues))
+    allowed_updates = dp.resolve_used_update_types()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(intake, bot, allowed_updates)
+        else:
+            await intake.start_polling(bot, handle_as_tasks=False, allowed_updates=allowed_updates)
+    finally:
+        loop = asyncio.get_running_loop()
+        for updates in queues:
+            await loop.run_in_executor(None, updates.put, None)
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+
+
+class DeferredCommitConnection:
+    """
+    Обертка над соединением SQLite, в которой commit() ничего не делает.
+
+    Функции модуля database сами вызывают conn.commit(); внутри пакета
+    записей фиксацию выполняет WriteCoalescer, один раз на весь пакет.
+    """
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        raise RuntimeError("rollback() is not allowed inside a write batch")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class WriteCoalescer:
+    """
+    Объединяет записи из параллельных обработчиков в общие транзакции.
+
+    Записи копятся в очереди и выполняются в потоке писателя одним
+    пакетом: не реже, чем раз в delay секунд, или сразу, когда набралось
+    max_batch записей. Пока пакет выполняется, следующие записи ждут
+    и уходят следующим пакетом. Каждая запись выполняется внутри
+    SAVEPOINT, поэтому ошибка одной записи откатывает только ее,
+    а остальные фиксируются общим commit.
+    """
+
+    def __init__(self, executor, connection, call=None, max_batch: int = 200, delay: float = 0.002):
+        """
+        :param executor: Однопоточный исполнитель писателя.
+        :param connection: Функция без аргументов, возвращающая контекстный
+            менеджер с соединением для записи.
+        :param call: Функция вида call(func, conn, *args), выполняющая запись;
+            по умолчанию func(conn, *args).
+        :param max_batch: Максимальное количество записей в одной транзакции.
+        :param delay: Время ожидания других записей в секундах.
+        """
+        self.executor = executor
+        self.connection = connection
+        self.call = call or (lambda func, conn, *args: func(conn, *args))
+        self.max_batch = max_batch
+        self.delay = delay
+        self.batches = 0
+        self.writes = 0
+        self._pending = []
+        self._timer = None
+        self._in_flight = False
+
+    def submit(self, func, *args) -> asyncio.Future:
+        """
+        Ставит запись в очередь.
+
+        :param func: Функция вида func(conn, *args) из модуля database.
+        :param args: Аргументы функции без соединения.
+        :return: Future с результатом функции; завершается после commit.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((func, args, future))
+        if self._in_flight:
+            return future
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.delay, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._in_flight or not self._pending:
+            return
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        self._in_flight = True
+        asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self._execute, [(func, args) for func, args, _ in batch])
+        except Exception as e:
+            logging.error(f"Write batch of {len(batch)} failed: {e}")
+            results = [(False, e)] * len(batch)
+        finally:
+            self._in_flight = False
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, _, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        # Записи, пришедшие во время выполнения пакета, уже подождали.
+        self._flush()
+
+    def _execute(self, batch):
+        with self.connection() as conn:
+            proxy = DeferredCommitConnection(conn)
+            results = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for func, args in batch:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        results.append((True, self.call(func, proxy, *args)))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        results.append((False, e))
+                    conn.execute("RELEASE write")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return results
+
+    async def drain(self):
+        """
+        Дожидается фиксации всех поставленных записей.
+        """
+        while self._pending or self._in_flight:
+            if not self._in_flight:
+                self._flush()
+            await asyncio.sleep(self.delay)